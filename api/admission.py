@@ -0,0 +1,113 @@
+"""
+    Admission control of incoming requests.
+
+    Requests are admitted by priority while there is capacity left. A burst of GraphQL reads
+    is rejected with 503 before it exhausts the database pool, so intents of game servers keep
+    being handled.
+"""
+
+from collections import defaultdict
+from enum import IntEnum
+
+from exceptions import UnavailableError
+from models import engine, async_engine
+from settings import settings
+from util import response
+
+
+class Priority(IntEnum):
+    # GraphQL views
+    LOW = 0
+    # REST API
+    NORMAL = 1
+    # Bukkit events and intents
+    HIGH = 2
+
+
+class AdmissionLimiter:
+
+    def __init__(self, limit: int, low_priority_share: float, pool_capacity: int):
+        self.limit = limit
+        self.low_priority_share = low_priority_share
+        self.pool_capacity = pool_capacity
+        self.in_flight = 0
+        self.admitted = defaultdict(int)
+        self.rejected = defaultdict(int)
+
+    def pool_saturation(self) -> float:
+        in_use = max(engine.pool.checkedout(), async_engine.sync_engine.pool.checkedout())
+        return in_use / self.pool_capacity if self.pool_capacity else 0
+
+    def _admits(self, priority: Priority) -> bool:
+        if priority >= Priority.HIGH:
+            return True
+
+        load = max(self.in_flight / self.limit, self.pool_saturation())
+        if priority == Priority.LOW:
+            return load < self.low_priority_share
+        return load < 1
+
+    def try_admit(self, priority: Priority) -> bool:
+        """ Take a slot if request of given priority can be handled now, it has to be released afterwards """
+        if not self._admits(priority):
+            self.rejected[priority.name] += 1
+            return False
+
+        self.admitted[priority.name] += 1
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def report(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "pool_saturation": round(self.pool_saturation(), 3),
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+        }
+
+
+admission_limiter = AdmissionLimiter(
+    settings.admission_limit,
+    settings.admission_low_priority_share,
+    settings.database_pool_size + settings.database_max_overflow,
+)
+
+OVERLOADED = "Server is overloaded, try again later"
+
+
+def admission(priority: Priority):
+    """ Route dependency rejecting requests with 503 when they can not be admitted """
+
+    async def admit():
+        if not admission_limiter.try_admit(priority):
+            raise UnavailableError(OVERLOADED)
+        try:
+            yield
+        finally:
+            admission_limiter.release()
+
+    return admit
+
+
+class AdmissionMiddleware:
+    """ Same as `admission`, for mounted ASGI apps """
+
+    def __init__(self, app, priority: Priority):
+        self.app = app
+        self.priority = priority
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if not admission_limiter.try_admit(self.priority):
+            return await response(http_status=503, error=OVERLOADED)(scope, receive, send)
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_limiter.release()
@@ -0,0 +1,69 @@
+"""
+    Process level caches.
+"""
+
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable
+
+
+def _group_name(group) -> str:
+    return getattr(group, "__name__", str(group))
+
+
+class LRUCache:
+    """
+        Least recently used entries are evicted once the cache holds `maxsize` of them.
+        Keys are tuples whose first item is the group (e.g. model) they are invalidated and counted by.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple, Any] = OrderedDict()
+        # bumped on invalidation, so that a value loaded before it is not stored after it
+        self._generations: dict[Any, int] = defaultdict(int)
+        self.hits: dict[str, int] = defaultdict(int)
+        self.misses: dict[str, int] = defaultdict(int)
+
+    def get(self, key: tuple, load: Callable[[], Any]) -> Any:
+        """ Cached value of the key, `load` is called on miss. None is not cached. """
+        group = key[0]
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits[_group_name(group)] += 1
+            return self._entries[key]
+
+        self.misses[_group_name(group)] += 1
+        generation = self._generations[group]
+        value = load()
+
+        if value is not None and self._generations[group] == generation:
+            self.put(key, value)
+
+        return value
+
+    def put(self, key: tuple, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, group=None):
+        """ Drop entries of the group, or everything """
+        if group is None:
+            self._entries.clear()
+            for known in self._generations:
+                self._generations[known] += 1
+            return
+
+        self._generations[group] += 1
+        for key in [key for key in self._entries if key[0] is group]:
+            del self._entries[key]
+
+    def report(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+        }
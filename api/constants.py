@@ -15,3 +15,38 @@ class NameStatus:
 
 
 AVAILABLE_PUBS_THRESHOLD = 2
+
+# seconds between recounts of in-process game/session counters
+COUNTERS_RECONCILE_INTERVAL = 60
+
+# buffered game events are written at least this often (seconds) or once this many are buffered
+EVENT_BUFFER_FLUSH_INTERVAL = 0.2
+EVENT_BUFFER_MAX_ROWS = 500
+# events kept while the database is unavailable, oldest ones are dropped over it
+EVENT_BUFFER_MAX_PENDING = 50_000
+
+# game event partitions are created this many months ahead, checked every interval (seconds)
+EVENT_PARTITIONS_AHEAD = 3
+EVENT_PARTITION_MAINTENANCE_INTERVAL = 6 * 60 * 60
+
+# raw events of games finished this many days ago are moved to cold storage,
+# up to batch size of games every interval (seconds)
+EVENT_ARCHIVE_RETENTION_DAYS = 30
+EVENT_ARCHIVE_BATCH = 50
+EVENT_ARCHIVE_INTERVAL = 60 * 60
+
+# database sessions held longer than this (seconds) are logged, open ones are checked every interval
+SESSION_HOLD_WARNING = 30
+SESSION_WATCH_INTERVAL = 30
+
+# GraphQL reads go to the replica while it lags at most this many seconds, checked every interval.
+# Requests with the header set read from the primary.
+REPLICA_MAX_LAG = 2
+REPLICA_LAG_CHECK_INTERVAL = 1
+FRESH_READ_HEADER = "X-Fresh-Read"
+
+# entries of maps, roles and permissions kept in process cache
+REFERENCE_CACHE_SIZE = 2048
+
+# events of one game / queue / match waiting to be handled before new ones are rejected
+EVENT_QUEUE_MAX_DEPTH = 256
@@ -0,0 +1,84 @@
+"""
+    Eager loading planner for blazelink tables.
+
+    Table fields named after model relationships are resolved by walking those relationships,
+    which lazy loads them one object at a time. Planner reads selection set of the GraphQL field
+    being resolved and turns selected relationships into loader options of the root query:
+    `selectinload` for collections and `joinedload` for single objects.
+"""
+
+from typing import Iterable
+
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode, SelectionSetNode
+from sqlalchemy import inspect
+from sqlalchemy.orm import selectinload, joinedload
+
+# relationships nested deeper than this are left lazy
+MAX_DEPTH = 4
+
+# fields that wrap selection of the same model, e.g. `items` of Page
+WRAPPER_FIELDS = {"items"}
+
+
+def _fields(selection_set: SelectionSetNode, fragments: dict) -> Iterable[FieldNode]:
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, FragmentSpreadNode):
+            yield from _fields(fragments[selection.name.value].selection_set, fragments)
+        elif isinstance(selection, InlineFragmentNode):
+            yield from _fields(selection.selection_set, fragments)
+
+
+def plan_paths(model, field_nodes: list[FieldNode], fragments: dict) -> frozenset[tuple[str, ...]]:
+    """ Relationship paths of the model selected by given fields """
+    paths = set()
+
+    def walk(mapper, selection_set, path):
+        for field in _fields(selection_set, fragments):
+            if field.selection_set is None:
+                continue
+
+            name = field.name.value
+
+            if name in WRAPPER_FIELDS and not path:
+                walk(mapper, field.selection_set, path)
+                continue
+
+            relationship = mapper.relationships.get(name)
+            if relationship is None or len(path) >= MAX_DEPTH:
+                continue
+
+            paths.add((*path, name))
+            walk(relationship.mapper, field.selection_set, (*path, name))
+
+    root = inspect(model).mapper
+    for node in field_nodes:
+        if node.selection_set is not None:
+            walk(root, node.selection_set, ())
+
+    return frozenset(paths)
+
+
+def loader_options(entity, paths: Iterable[tuple[str, ...]]) -> list:
+    """ Loader options for relationship paths of the entity, entity may be aliased """
+    options = []
+
+    for path in sorted(paths):
+        option = None
+        owner = entity
+
+        for name in path:
+            attr = getattr(owner, name)
+            many = attr.property.uselist
+
+            if option is None:
+                option = selectinload(attr) if many else joinedload(attr)
+            else:
+                option = option.selectinload(attr) if many else option.joinedload(attr)
+
+            owner = attr.property.mapper.class_
+
+        options.append(option)
+
+    return options
@@ -1,10 +1,12 @@
 import asyncio
 import logging
 import random
+from collections import defaultdict
 from datetime import datetime
 
 from sqlalchemy import delete
-from sqlmodel import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select, col
 
 from adapters.telegram import bot, safe_send
 from events.event import IntentResponse
@@ -17,27 +19,32 @@ from schemas.permission import Permission
 from services.game import find_team_for_player, PluginMap, create_game
 from services.minestrike import MineStrike
 from events.manager import EventManager
-from models import InGameTeam, Game, Player, PlayerSession, Map, GamePlayerEvent, Round, Session
+from models import InGameTeam, Game, Player, PlayerSession, Map, GamePlayerEvent, Round, Session, AsyncSession, \
+    DamageCode
 from services.permission import has_permission
 from services.ranked import compute_elo
+from services.damage import modifier_flags, get_damage_code
+from services.ingestion import event_buffer
+from services.stats import record_game_result, update_game_score, refresh_leaderboard, game_players
+from services.counters import game_counter, session_counter, reconcile_counters
 from settings import settings
 
-BukkitEventManager = EventManager()
+BukkitEventManager = EventManager("bukkit")
 
 
 @BukkitEventManager.on(ServerStartEvent)
 async def on_plugin_start(minestrike: MineStrike, event: ServerStartEvent):
     print("server started")
 
-    stmt = Session().exec(
-        select(PlayerSession).join(Player).where(Player.uuid == None)
-    ).all()
+    temp_sessions = select(PlayerSession.id).join(Player).where(Player.uuid == None)
 
-    print("Delete temp player sessions", stmt)
+    d = delete(PlayerSession).where(PlayerSession.id.in_(temp_sessions))
+    res = await AsyncSession().execute(d)
+    await AsyncSession().commit()
 
-    d = delete(PlayerSession).where(PlayerSession.id.in_([x.id for x in stmt]))
-    Session().execute(d)
-    Session().commit()
+    print("Deleted temp player sessions", res.rowcount)
+
+    await reconcile_counters()
 
 
 @BukkitEventManager.on(PlayerLeaveGameIntentEvent)
@@ -53,15 +60,20 @@ async def on_game_leave_request(minestrike: MineStrike, event: PlayerLeaveGameIn
 
 @BukkitEventManager.on(GameDeleteIntentEvent)
 async def on_game_delete_request(minestrike: MineStrike, event: GameDeleteIntentEvent):
-    game = Game.of(event.game)
+    game = await Game.async_of(event.game)
 
     if game is None:
         return IntentResponse.failure(
             f"Game {event.game.obj_id} not found on backend"
         )
 
+    old_status = game.status
     game.status = Game.Status.TERMINATED
-    Session().commit()
+    game.finished_at = game.finished_at or datetime.now()
+    await AsyncSession().commit()
+
+    game_counter.move((game.mode, old_status), (game.mode, game.status))
+    _round_ids.pop(game.id, None)
 
     # let server know that game is terminated
     await minestrike.terminate_game(game)
@@ -162,7 +174,7 @@ async def on_whitelist_request(minestrike: MineStrike, event: ChangePlayerWhitel
 async def on_player_generated_code(minestrike: MineStrike, event: PlayerGenerateCodeIntent):
     print("on_player_generated_code", event)
 
-    player = Player.of(event.player)
+    player = await Player.async_of(event.player)
 
     if player is None:
         return
@@ -170,7 +182,7 @@ async def on_player_generated_code(minestrike: MineStrike, event: PlayerGenerate
     code = random.randint(100000, 999999)
 
     player.verification_code = code
-    Session().commit()
+    await AsyncSession().commit()
 
     return IntentResponse.success(
         f"Your verification code is {code}"
@@ -344,6 +356,10 @@ async def on_game_end(minestrike: MineStrike, event: PreGameEndEvent):
 
     game = Game.of(event.game)
 
+    # game end might be re-sent, count its result only once
+    old_status = game.status
+    already_finished = old_status == Game.Status.FINISHED
+
     if None not in (event.looser, event.winner):
         winner = InGameTeam.of(event.winner)
         looser = InGameTeam.of(event.looser)
@@ -360,30 +376,47 @@ async def on_game_end(minestrike: MineStrike, event: PreGameEndEvent):
             looser.deduct_elo(loose)
 
     game.status = Game.Status.FINISHED
+    game.finished_at = game.finished_at or datetime.now()
+    Session().flush()
+
+    if not already_finished:
+        Session().execute(record_game_result(game.id))
+        Session().execute(refresh_leaderboard(col(Player.id).in_(game_players(game.id))))
+
     Session().commit()
 
+    game_counter.move((game.mode, old_status), (game.mode, game.status))
+    _round_ids.pop(game.id, None)
+
 
 @BukkitEventManager.on(GameStartedEvent)
 async def on_game_start(minestrike: MineStrike, event: GameStartedEvent):
-    game = Game.of(event.game)
+    game = await Game.async_of(event.game)
+    old_status = game.status
     game.status = Game.Status.STARTED
     game.started_at = datetime.now()
 
     # delete all sessions with AWAY status from the game
-    for session in game.sessions:
-        if session.state == PlayerSession.State.AWAY:
-            Session().delete(session)
+    res = await AsyncSession().execute(
+        delete(PlayerSession).where(
+            PlayerSession.game_id == game.id,
+            PlayerSession.state == PlayerSession.State.AWAY,
+        )
+    )
 
-    Session().commit()
+    await AsyncSession().commit()
+
+    game_counter.move((game.mode, old_status), (game.mode, game.status))
+    session_counter.add((game.mode, PlayerSession.State.AWAY), -res.rowcount)
 
 
 @BukkitEventManager.on(PlayerJoinServerEvent)
 async def on_player_join_server(minestrike: MineStrike, event: PlayerJoinServerEvent):
     print("Player", event.player, "joined server")
-    player = Player.of(event.player)
+    player = await Player.async_of(event.player)
 
     player.in_server = True
-    Session.commit()
+    await AsyncSession().commit()
 
     safe_send(
         f"Player {player.username} has joined the server"
@@ -392,18 +425,25 @@ async def on_player_join_server(minestrike: MineStrike, event: PlayerJoinServerE
 
 @BukkitEventManager.on(PlayerLeaveServerEvent)
 async def on_player_leave_server(minestrike: MineStrike, event: PlayerLeaveServerEvent):
-    player: Player = Player.of(event.player)
+    player: Player = await Player.async_of(event.player)
 
     player.in_server = False
     player.last_seen = datetime.now()
 
-    session = player.get_active_session()
+    stmt = select(PlayerSession, Game.mode).join(Game, onclause=Game.id == PlayerSession.game_id).where(
+        PlayerSession.state == PlayerSession.State.IN_GAME,
+        PlayerSession.player_id == player.id
+    )
+    active = (await AsyncSession().execute(stmt)).first()
 
     # if player was in game, leave it
-    if session:
-        session.state = PlayerSession.State.AWAY
+    if active:
+        active.PlayerSession.state = PlayerSession.State.AWAY
 
-    Session().commit()
+    await AsyncSession().commit()
+
+    if active:
+        session_counter.move((active.mode, PlayerSession.State.IN_GAME), (active.mode, PlayerSession.State.AWAY))
 
     safe_send(
         f"Player {player.username} has left the server"
@@ -413,89 +453,123 @@ async def on_player_leave_server(minestrike: MineStrike, event: PlayerLeaveServe
 @BukkitEventManager.on(RoundWinEvent)
 async def on_round_win(minestrike: MineStrike, event: RoundWinEvent):
 
-    game = Game.of(event.game)
-    winner = InGameTeam.of(event.winner)
-    looser = InGameTeam.of(event.looser)
+    game_id = event.game.obj_id
+    winner_id = event.winner.obj_id if event.winner else None
+
+    # round might've been already created by a death in it, or won before,
+    # lock it so that score is moved from the previous winner consistently
+    game_round = await get_or_create_round(game_id, event.roundNumber, for_update=True)
+
+    old_winner_id = game_round.winner_id
+    game_round.winner_id = winner_id
+    game_round.win_reason = event.reason
+
+    await AsyncSession().execute(update_game_score(game_id, old_winner_id, winner_id))
+    await AsyncSession().commit()
 
+
+async def get_or_create_round(game_id: int, number: int, for_update=False) -> Round:
     stmt = select(Round).where(
-        Round.game_id == game.id,
-        Round.number == event.roundNumber
+        Round.game_id == game_id,
+        Round.number == number
     )
 
-    game_round = Session().exec(stmt).one_or_none()
+    if for_update:
+        stmt = stmt.with_for_update()
+
+    game_round = (await AsyncSession().exec(stmt)).one_or_none()
 
     if game_round is None:
-        game_round = Round(
-            game_id=game.id,
-            number=event.roundNumber,
-            winner=winner,
-            win_reason=event.reason
+        # concurrent event could've created the same round in the meantime
+        await AsyncSession().execute(
+            insert(Round).values(game_id=game_id, number=number).on_conflict_do_nothing(
+                index_elements=[Round.game_id, Round.number]
+            )
         )
-        Session().add(game_round)
-        Session().commit()
-        Session().refresh(game_round)
-    else:
-        game_round.winner = winner
-        Session().commit()
+        game_round = (await AsyncSession().exec(stmt)).one()
+
+    return game_round
+
+
+# game id -> round number -> round id, rounds are never deleted, so their ids can be cached until game ends
+_round_ids: dict[int, dict[int, int]] = defaultdict(dict)
+
+
+async def get_round_id(game_id: int, number: int) -> int:
+    rounds = _round_ids[game_id]
+
+    if number not in rounds:
+        rounds[number] = (await get_or_create_round(game_id, number)).id
+        await AsyncSession().commit()
+
+    return rounds[number]
+
+
+async def get_player_side(game_id: int, player_id: int) -> bool | None:
+    """ Whether player currently plays as CT in given game """
+    stmt = (
+        select(InGameTeam.is_ct)
+        .join(PlayerSession, onclause=PlayerSession.roster_id == InGameTeam.id)
+        .where(
+            PlayerSession.game_id == game_id,
+            PlayerSession.player_id == player_id
+        )
+    )
+    return (await AsyncSession().exec(stmt)).first()
 
 
 @BukkitEventManager.on(PlayerDeathEvent)
 async def on_player_death(minestrike: MineStrike, event: PlayerDeathEvent):
 
-    game = Game.of(event.game)
-    damagee = Player.of(event.damagee)
-    damager = Player.of(event.damager)
-
     if event.round == -1:
         print("Warmup", event)
         return
 
-    stmt = select(Round).where(
-        Round.game_id == game.id,
-        Round.number == event.round
-    )
+    game_id = event.game.obj_id
+    damagee_id = event.damagee.obj_id
+    damager_id = event.damager.obj_id if event.damager else None
 
-    game_round = Session().exec(stmt).one_or_none()
+    round_id = await get_round_id(game_id, event.round)
+    created_at = datetime.now()
 
-    if game_round is None:
+    meta = {
+        "damage_source": event.damageSource,  # weapon name / grenade name
+        "damage_type": event.reason,  # fire, grenade, gun, etc
+        "modifiers": event.modifiers,  # headshot, blinded, wallbangPenalty, etc
+    }
 
-        game_round = Round(
-            game_id=game.id,
-            number=event.round,
-        )
-        Session().add(game_round)
-        Session().commit()
-        Session().refresh(game_round)
+    # typed copies of meta used by stats queries
+    damage = dict(
+        modifiers=modifier_flags(event.modifiers),
+        damage_source_id=await get_damage_code(DamageCode.SOURCE, event.damageSource),
+        damage_type_id=await get_damage_code(DamageCode.TYPE, event.reason),
+    )
 
-    game_event = GamePlayerEvent(
-        game_id=game.id,
-        player_id=damagee.id,
+    # events and stats they feed are written together by the buffer,
+    # stats are not counted for events it refused (e.g. player without side)
+    event_buffer.add_event(
+        stats=dict(deaths=1),
+        game_id=game_id,
+        player_id=damagee_id,
         event=GamePlayerEvent.Type.DEATH,
-        round_id=game_round.id,
-        is_ct=game.get_player_team(damagee).is_ct,
-        meta={
-            "damage_source": event.damageSource,  # weapon name / grenade name
-            "damage_type": event.reason,  # fire, grenade, gun, etc
-            "modifiers": event.modifiers,  # headshot, blinded, wallbangPenalty, etc
-        }
+        round_id=round_id,
+        is_ct=await get_player_side(game_id, damagee_id),
+        meta=meta,
+        created_at=created_at,
+        **damage
     )
 
-    Session().add(game_event)
-    Session().commit()
+    if damager_id:
+        hs = int(bool(damage["modifiers"] & GamePlayerEvent.Modifier.headshot))
 
-    if damager:
-        game_event = GamePlayerEvent(
-            game_id=game.id,
-            player_id=damager.id,
+        event_buffer.add_event(
+            stats=dict(kills=1, hs=hs),
+            game_id=game_id,
+            player_id=damager_id,
             event=GamePlayerEvent.Type.KILL,
-            round_id=game_round.id,
-            is_ct=game.get_player_team(damager).is_ct,
-            meta={
-                "damage_source": event.damageSource,  # weapon name / grenade name
-                "damage_type": event.reason,  # fire, grenade, gun, etc
-                "modifiers": event.modifiers,  # headshot, blinded, wallbangPenalty, etc
-            }
+            round_id=round_id,
+            is_ct=await get_player_side(game_id, damager_id),
+            meta=meta,
+            created_at=created_at,
+            **damage
         )
-
-        Session().add(game_event)
-        Session().commit()
@@ -0,0 +1,149 @@
+"""
+    Ordered execution of event handling per entity.
+
+    Jobs submitted under the same key (e.g. events of one game) run one after another in order
+    of submission, jobs of different keys run concurrently. Every key has a bounded queue,
+    a job that does not fit is rejected instead of delaying everything behind it.
+"""
+
+import asyncio
+import logging
+import time
+import traceback
+from collections import deque
+from typing import Callable, Awaitable, Hashable, Any
+
+from metrics import Histogram
+from unit_of_work import unit_of_work
+
+# upper bounds (ms) of buckets of time jobs waited in queue before they started
+LAG_BUCKETS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000]
+
+
+class ExecutorFull(Exception):
+    pass
+
+
+class ExecutorStopped(Exception):
+    pass
+
+
+class KeyStats:
+
+    def __init__(self):
+        self.processed = 0
+        self.last_lag_ms = 0.
+        self.max_lag_ms = 0.
+
+    def observe(self, lag_ms: float):
+        self.processed += 1
+        self.last_lag_ms = lag_ms
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+
+
+class KeyedExecutor:
+
+    def __init__(self, name: str, max_depth: int):
+        self.name = name
+        self.max_depth = max_depth
+        # key -> jobs waiting to start, key is present while its worker runs
+        self._queues: dict[Hashable, deque[tuple[Callable[[], Awaitable], asyncio.Future, float]]] = {}
+        self._stats: dict[Hashable, KeyStats] = {}
+        # loop keeps only weak references to tasks
+        self._workers: dict[Hashable, asyncio.Task] = {}
+        self.lag = Histogram(LAG_BUCKETS)
+        self.rejected = 0
+
+    def submit(self, key: Hashable, job: Callable[[], Awaitable]) -> asyncio.Future:
+        """ Schedule job after all jobs of the key submitted before, future resolves to its result """
+        queue = self._queues.get(key)
+
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._stats[key] = KeyStats()
+            self._workers[key] = asyncio.create_task(self._work(key, queue), name=f"{self.name} {key}")
+
+        elif len(queue) >= self.max_depth:
+            self.rejected += 1
+            raise ExecutorFull(f"{len(queue)} jobs of {key} are already waiting")
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append((job, future, time.monotonic()))
+        return future
+
+    async def _work(self, key: Hashable, queue: deque):
+        stats = self._stats[key]
+
+        try:
+            while queue:
+                job, future, submitted_at = queue.popleft()
+
+                lag_ms = (time.monotonic() - submitted_at) * 1000
+                self.lag.observe(lag_ms)
+                stats.observe(lag_ms)
+
+                # submitter is not waiting anymore
+                if future.cancelled():
+                    continue
+
+                try:
+                    # worker lives as long as its key keeps getting jobs, sessions must not
+                    async with unit_of_work(f"{self.name} {key}"):
+                        result = await job()
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # jobs left behind by a worker that did not finish would never run
+            del self._queues[key]
+            del self._stats[key]
+            del self._workers[key]
+
+            for _, future, _ in queue:
+                if not future.done():
+                    future.set_exception(ExecutorStopped(f"Worker of {key} stopped"))
+
+    def report(self) -> dict:
+        return {
+            "active_keys": len(self._queues),
+            "rejected": self.rejected,
+            "lag_ms": self.lag.report(),
+            "keys": {
+                str(key): {
+                    "depth": len(queue),
+                    "processed": self._stats[key].processed,
+                    "last_lag_ms": round(self._stats[key].last_lag_ms, 3),
+                    "max_lag_ms": round(self._stats[key].max_lag_ms, 3),
+                }
+                for key, queue in self._queues.items()
+            },
+        }
+
+
+def report_failure(future: asyncio.Future):
+    """ Done callback logging failure of a job nobody awaits """
+    if future.cancelled() or future.exception() is None:
+        return
+
+    logging.error(f"Event handler failed: {future.exception()!r}")
+    traceback.print_exception(future.exception())
+
+
+def run_detached(key: Hashable | None, executor: KeyedExecutor, job: Callable[[], Awaitable[Any]]):
+    """ Run job without waiting for it, in order of its key if it has one """
+    if key is None:
+        future = asyncio.ensure_future(job())
+    else:
+        try:
+            future = executor.submit(key, job)
+        except ExecutorFull as e:
+            logging.warning(f"Dropped event handler of {executor.name}: {e}")
+            return
+
+    future.add_done_callback(report_failure)
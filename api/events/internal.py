@@ -1,3 +1,3 @@
 from events.manager import EventManager
 
-internalHandler = EventManager()
+internalHandler = EventManager("internal")
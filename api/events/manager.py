@@ -2,15 +2,20 @@ import asyncio
 import functools
 import traceback
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Type, Any
 
 from blazelink.schemas import IncomingEvent
 from pydantic import BaseModel
 
+from constants import EVENT_QUEUE_MAX_DEPTH
 from events.event import IntentResponse
+from events.executor import KeyedExecutor, run_detached
 from events.schemas.bukkit import IntentEvent
 
+# entities whose events are handled in order of arrival, by name of the event field referencing them
+ORDERED_ENTITIES = {"game": "Game", "queue": "PlayerQueue", "match": "Match"}
+
 
 class WaitObject:
 
@@ -38,47 +43,143 @@ class Waiter:
     type: str
     # future that will be resolved when waiter is completed
     future: asyncio.Future
+    # index and key the waiter was registered under, model may change while it waits
+    index: dict[tuple, list["Waiter"]] | None = field(default=None, repr=False, compare=False)
+    key: tuple | None = field(default=None, compare=False)
 
 
-class EventManager:
+def _is_hashable(model) -> bool:
+    try:
+        hash(model)
+    except TypeError:
+        return False
+    return True
 
-    def __init__(self):
-        self.handlers = defaultdict(list)
-        self.waiters: list[Waiter] = []
 
-    def _execute_waiters(self, event, model, waiter_type):
+def _waiter_entity_key(model):
+    """ Key waiter on the entity is indexed by, None if it can only be matched by scanning """
+    if hasattr(model, 'id'):
+        return 'id', type(model), model.id
+    if _is_hashable(model):
+        return 'eq', model
+    return None
 
-        waiters_to_remove = []
-        for waiter in self.waiters:
 
-            if model != waiter.model and (
-                    (not hasattr(model, 'id') or not hasattr(waiter.model, 'id'))
-                    or not isinstance(model, type(waiter.model))
-                    or model.id != waiter.model.id
-            ):
-                continue
+def _event_entity_keys(model):
+    """
+        Keys of waiters the entity of an event completes: waiters on the same entity
+        or, for entities with id, on any entity of the same or base class with that id
+    """
+    if hasattr(model, 'id'):
+        for cls in type(model).__mro__:
+            yield 'id', cls, model.id
+    if _is_hashable(model):
+        yield 'eq', model
 
-            if waiter_type != waiter.type:
-                continue
 
-            if isinstance(event, IncomingEvent):
-                if event.type != waiter.event:
-                    continue
+def ordering_key(event: IncomingEvent, entity) -> tuple[str, str] | None:
+    """ Game, queue or match the event is about, either as its entity or referenced by its data """
+    entity_name = type(entity).__name__
+    if entity_name in ORDERED_ENTITIES.values() and getattr(entity, 'id', None) is not None:
+        return entity_name, str(entity.id)
 
-            elif event != waiter.event:
-                continue
+    data = event.data if isinstance(event.data, dict) else {}
+    for field, name in ORDERED_ENTITIES.items():
+        ref = data.get(field)
+        obj_id = ref.get('obj_id') if isinstance(ref, dict) else getattr(ref, 'obj_id', None)
+        if obj_id is not None:
+            return name, str(obj_id)
+
+    return None
+
+
+async def _call_handler(handler, entity, data):
+    response = handler(entity, data)
+    if asyncio.iscoroutine(response):
+        response = await response
+    return response
+
+
+class EventManager:
+
+    def __init__(self, name: str = "events"):
+        self.name = name
+        self.handlers = defaultdict(list)
+        self.executor = KeyedExecutor(name, EVENT_QUEUE_MAX_DEPTH)
+        # (event name, waiter type, entity key) -> waiters, see `_waiter_entity_key`
+        self.waiters: dict[tuple, list[Waiter]] = defaultdict(list)
+        # (event name, waiter type) -> waiters on unhashable entities without id
+        self.unindexed_waiters: dict[tuple, list[Waiter]] = defaultdict(list)
+        # timeouts of waiters that are still pending
+        self.timers: set[asyncio.TimerHandle] = set()
+
+    def _add_waiter(self, waiter: Waiter):
+        entity_key = _waiter_entity_key(waiter.model)
+        if entity_key is None:
+            waiter.index, waiter.key = self.unindexed_waiters, (waiter.event, waiter.type)
+        else:
+            waiter.index, waiter.key = self.waiters, (waiter.event, waiter.type, entity_key)
+
+        waiter.index[waiter.key].append(waiter)
+        # timed out and cancelled waiters leave the index right away, completed ones are already gone
+        waiter.future.add_done_callback(lambda _: self._remove_waiter(waiter))
+
+    def _remove_waiter(self, waiter: Waiter):
+        bucket = waiter.index.get(waiter.key)
+        if bucket is None:
+            return
+
+        if waiter in bucket:
+            bucket.remove(waiter)
+        if not bucket:
+            del waiter.index[waiter.key]
+
+    def pending_waiters(self) -> int:
+        return sum(map(len, self.waiters.values())) + sum(map(len, self.unindexed_waiters.values()))
+
+    def report(self) -> dict:
+        return {
+            "pending_waiters": self.pending_waiters(),
+            "pending_timers": len(self.timers),
+        }
+
+    def _set_timeout(self, future: asyncio.Future, timeout: float):
+        """ Fail the future after timeout, timer is cancelled as soon as future is done """
+
+        def fail_if_did_not_succeed():
+            self.timers.discard(timer)
+            if not future.done():
+                future.set_exception(TimeoutError(f'Event Waiter timed out after {timeout} seconds'))
+
+        def cancel_timer(_):
+            timer.cancel()
+            self.timers.discard(timer)
+
+        timer = asyncio.get_running_loop().call_later(timeout, fail_if_did_not_succeed)
+        self.timers.add(timer)
+        future.add_done_callback(cancel_timer)
+
+    def _execute_waiters(self, event, model, waiter_type):
+        event_name = event.type if isinstance(event, IncomingEvent) else event
+
+        matched = []
+        for entity_key in _event_entity_keys(model):
+            matched.extend(self.waiters.pop((event_name, waiter_type, entity_key), ()))
 
-            waiters_to_remove.append(waiter)
+        unindexed = self.unindexed_waiters.get((event_name, waiter_type))
+        if unindexed:
+            matched.extend(waiter for waiter in unindexed if waiter.model == model)
+            unindexed[:] = [waiter for waiter in unindexed if waiter.model != model]
+            if not unindexed:
+                del self.unindexed_waiters[(event_name, waiter_type)]
 
+        for waiter in matched:
             if waiter.future.done():
                 print("[WARN] waiter already completed")
                 continue
 
             waiter.future.set_result(event)
 
-        for waiter in waiters_to_remove:
-            self.waiters.remove(waiter)
-
     def on(self, event: Type[BaseModel]):
         def inner(func):
 
@@ -119,6 +220,17 @@ class EventManager:
 
         return await self.propagate_abstract_event(abs_event, sender)
 
+    async def propagate_ordered_event(self, event: IncomingEvent, entity):
+        """
+            Propagate event once previous events of the same game, queue or match are handled.
+            Raises `ExecutorFull` when too many of them are waiting.
+        """
+        key = ordering_key(event, entity)
+        if key is None:
+            return await self.propagate_abstract_event(event, entity)
+
+        return await self.executor.submit(key, lambda: self.propagate_abstract_event(event, entity))
+
     async def propagate_abstract_event(self, event: IncomingEvent, entity, blocking=True):
         """
             Propagate generic event with strict schema
@@ -130,15 +242,18 @@ class EventManager:
         self._execute_waiters(event, entity, 'on')
 
         awaited_response = None
+        key = None if blocking else ordering_key(event, entity)
 
         for handler in self.handlers[event.type]:
+            if not blocking:
+                # handlers of one game / queue / match run in order of events, others right away
+                run_detached(key, self.executor, functools.partial(_call_handler, handler, entity, event.data))
+                continue
+
             try:
                 response = handler(entity, event.data)
                 if asyncio.iscoroutine(response):
-                    if not blocking:
-                        asyncio.create_task(response)
-                    else:
-                        awaited_response = await response
+                    awaited_response = await response
                 else:
                     awaited_response = response
             except Exception:
@@ -153,18 +268,13 @@ class EventManager:
         if isinstance(event, type) and issubclass(event, BaseModel):
             event = event.__name__
 
-        async def fail_task_if_did_not_succeed(future: asyncio.Future):
-            await asyncio.sleep(timeout)
-            if not future.done():
-                future.set_exception(TimeoutError(f'Event Waiter timed out after {timeout} seconds'))
-
         def register_waiter(model, waiter_type):
             future = asyncio.Future()
 
             if timeout:
-                asyncio.create_task(fail_task_if_did_not_succeed(future))
+                self._set_timeout(future, timeout)
 
-            self.waiters.append(Waiter(event, model, waiter_type, future))
+            self._add_waiter(Waiter(event, model, waiter_type, future))
             return future
 
         return WaitObject(register_waiter)
@@ -11,7 +11,7 @@ from api.events.schemas.websocket import BukkitInitEvent, PingEvent, ConfirmEven
 from api.exceptions import AuthorizationError
 from api.models import Session, PlayerSession, Player
 
-WsEventManager = EventManager()
+WsEventManager = EventManager("websocket")
 
 
 @WsEventManager.on(ConfirmEvent)
@@ -22,10 +22,13 @@ from sqlmodel import select
 
 from models import (
     PlayerPermission,
-    Session,
-    session_maker
+    session_maker,
+    warm_reference_cache,
 )
 
+from admission import AdmissionMiddleware, Priority
+from metrics import count_queries, stop_counting_queries
+from unit_of_work import unit_of_work, watch_held_sessions_periodically, wait_closed
 from queries import table_manager
 print("Table manager initialized")
 from routes import monitoring
@@ -40,6 +43,11 @@ from fastapi.middleware.cors import CORSMiddleware
 
 
 from exceptions import install_exception_handlers
+from services.counters import reconcile_counters_periodically
+from services.ingestion import event_buffer
+from services.partitions import maintain_event_partitions_periodically
+from services.archive import archive_finished_games_periodically
+from services.replica import replica_monitor, wants_fresh_data
 from settings import settings
 
 # from api.graphql.query import schema
@@ -66,14 +74,12 @@ app.add_middleware(
 )
 
 
-async def clear_sessions():
-    try:
+async def request_unit_of_work():
+    async with unit_of_work("request"):
         yield
-    finally:
-        Session.remove()
 
 app.include_router(prefix="/api", router=get_v1_router(), dependencies=[
-    Depends(clear_sessions)
+    Depends(request_unit_of_work)
 ])
 
 app.include_router(prefix="/blazelink-mgmt", router=monitoring.router)
@@ -89,13 +95,17 @@ def status():
 @app.on_event("startup")
 def ensure_defaults():
     # make sure default permission exists
-    stmt = select(PlayerPermission).where(PlayerPermission.name == 'bms.player.any')
-    res = Session().exec(stmt)
-    res = res.first()
-    if res is None:
-        perm = PlayerPermission(name='bms.player.any')
-        Session().add(perm)
-        Session().commit()
+    # startup runs in the lifespan task, which would hold a scoped session for the whole app lifetime
+    with session_maker() as session:
+        stmt = select(PlayerPermission).where(PlayerPermission.name == 'bms.player.any')
+        res = session.exec(stmt)
+        res = res.first()
+        if res is None:
+            perm = PlayerPermission(name='bms.player.any')
+            session.add(perm)
+            session.commit()
+
+    warm_reference_cache()
 
 
 # @app.on_event("startup")
@@ -151,10 +161,26 @@ signaler = Signaler(
 class SessionExtension(Extension):
 
     def request_started(self, context: ContextValue) -> None:
-        context["database_session"] = session_maker()
+        # views only read, they go to the replica unless it lags behind
+        read_session_maker, async_read_session_maker = replica_monitor.session_makers(
+            fresh=wants_fresh_data(context.get("request"))
+        )
+        context["database_session"] = read_session_maker()
+        context["async_database_session"] = async_read_session_maker()
+        context["query_counter"], context["query_counter_token"] = count_queries()
+        context["identity_map"] = {}
 
     def request_finished(self, context: ContextValue) -> None:
+        context.pop("identity_map", None)
         context["database_session"].close()
+        # extension hooks are synchronous, release connection in the background
+        asyncio.create_task(context["async_database_session"].close())
+        stop_counting_queries(context["query_counter_token"])
+        logging.debug(f"GraphQL request executed {context['query_counter'].count} queries")
+
+    def format(self, context: ContextValue) -> dict:
+        # reported in "extensions" of the response, to verify batching from the client
+        return {"queries": context["query_counter"].count}
 
 print("create schema")
 
@@ -170,7 +196,8 @@ asgi_app = GraphQL(
 
 app.mount(
     "/graphql",
-    asgi_app
+    # views are the first to be shed when the database pool runs out
+    AdmissionMiddleware(asgi_app, Priority.LOW)
 )
 
 
@@ -178,6 +205,18 @@ app.mount(
 async def start_things():
     c = signaler.start()
     asyncio.create_task(c)
+    asyncio.create_task(reconcile_counters_periodically())
+    asyncio.create_task(event_buffer.flush_periodically())
+    asyncio.create_task(maintain_event_partitions_periodically())
+    asyncio.create_task(archive_finished_games_periodically())
+    asyncio.create_task(watch_held_sessions_periodically())
+    asyncio.create_task(replica_monitor.monitor_periodically())
+
+
+@app.on_event("shutdown")
+async def flush_buffers():
+    await event_buffer.flush()
+    await wait_closed()
 
 
 @connection_manager.on_authorized("bukkit")
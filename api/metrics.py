@@ -0,0 +1,107 @@
+"""
+    Database usage metrics.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# upper bounds (ms) of connection checkout wait buckets
+CHECKOUT_WAIT_BUCKETS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000]
+
+
+class QueryCounter:
+    """ Number of statements executed while counter was active, see `count_queries` """
+
+    def __init__(self):
+        self.count = 0
+
+
+# counter of the GraphQL request being handled. Tasks spawned while resolving
+# copy the context, so they increment the same counter.
+_query_counter: ContextVar[QueryCounter | None] = ContextVar("query_counter", default=None)
+
+
+def _on_execute(*args, **kwargs):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+
+def instrument_engine(engine: Engine):
+    """ Count statements executed by the engine, for async engines pass `sync_engine` """
+    event.listen(engine, "before_cursor_execute", _on_execute)
+
+
+def count_queries() -> tuple[QueryCounter, object]:
+    """ Start counting statements of current context, returns counter and token to stop counting """
+    counter = QueryCounter()
+    return counter, _query_counter.set(counter)
+
+
+def stop_counting_queries(token):
+    _query_counter.reset(token)
+
+
+class Histogram:
+    """ Counts of observed values per bucket, bucket is given by its upper bound """
+
+    def __init__(self, bounds: list[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def report(self) -> dict:
+        return {
+            "buckets": {
+                **{f"le_{bound}": count for bound, count in zip(self.bounds, self.counts)},
+                "inf": self.counts[-1],
+            },
+            "count": self.count,
+            "sum": round(self.sum, 3),
+        }
+
+
+class _MeasuredPool:
+    """ Records how long checkouts waited for a connection, including connecting new ones """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_wait = Histogram(CHECKOUT_WAIT_BUCKETS)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.checkout_wait.observe((time.perf_counter() - started) * 1000)
+
+
+class MeasuredQueuePool(_MeasuredPool, QueuePool):
+    pass
+
+
+class MeasuredAsyncQueuePool(_MeasuredPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_report(pool) -> dict:
+    report = {
+        "size": pool.size(),
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    if isinstance(pool, _MeasuredPool):
+        report["checkout_wait_ms"] = pool.checkout_wait.report()
+    return report
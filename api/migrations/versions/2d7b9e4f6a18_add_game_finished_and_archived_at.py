@@ -0,0 +1,27 @@
+"""Add game finished and events archived timestamps
+
+Revision ID: 2d7b9e4f6a18
+Revises: f4a9b2c7e813
+Create Date: 2026-10-18 20:41:09.553871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '2d7b9e4f6a18'
+down_revision = 'f4a9b2c7e813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('game', sa.Column('finished_at', sa.DateTime(), nullable=True))
+    op.add_column('game', sa.Column('events_archived_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('game', 'events_archived_at')
+    op.drop_column('game', 'finished_at')
@@ -0,0 +1,80 @@
+"""Add hot path indexes
+
+Revision ID: 3f1b2c9d7e4a
+Revises: 0acf60b9ca15
+Create Date: 2026-10-18 12:10:42.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1b2c9d7e4a'
+down_revision = '0acf60b9ca15'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns, unique)
+INDEXES = [
+    ('uq_playersession_game_id_player_id', 'playersession', ['game_id', 'player_id'], True),
+    ('ix_playersession_player_id_state', 'playersession', ['player_id', 'state'], False),
+    ('uq_round_game_id_number', 'round', ['game_id', 'number'], True),
+    ('ix_gameplayerevent_player_id_event', 'gameplayerevent', ['player_id', 'event'], False),
+    ('ix_gameplayerevent_game_id_player_id', 'gameplayerevent', ['game_id', 'player_id'], False),
+    ('ix_game_mode_status', 'game', ['mode', 'status'], False),
+    # not unique, keys were never deduplicated and a failed concurrent build leaves an INVALID index
+    ('ix_authsession_session_key', 'authsession', ['session_key'], False),
+    ('ix_player_uuid', 'player', ['uuid'], False),
+]
+
+
+def upgrade() -> None:
+    # Unique indexes can't be built while duplicates exist.
+    # Rounds: keep the oldest row, move winner and events of duplicates onto it.
+    op.execute("""
+        UPDATE round AS keep
+        SET winner_id = latest.winner_id, win_reason = latest.win_reason
+        FROM (
+            SELECT DISTINCT ON (game_id, number) game_id, number, winner_id, win_reason
+            FROM round
+            WHERE winner_id IS NOT NULL AND (game_id, number) IN (
+                SELECT game_id, number FROM round GROUP BY game_id, number HAVING count(*) > 1
+            )
+            ORDER BY game_id, number, id DESC
+        ) AS latest
+        WHERE keep.game_id = latest.game_id AND keep.number = latest.number
+    """)
+    op.execute("""
+        UPDATE gameplayerevent AS e
+        SET round_id = d.keep_id
+        FROM (SELECT id, min(id) OVER (PARTITION BY game_id, number) AS keep_id FROM round) AS d
+        WHERE e.round_id = d.id AND d.id <> d.keep_id
+    """)
+    op.execute("""
+        DELETE FROM round AS r
+        USING (SELECT id, min(id) OVER (PARTITION BY game_id, number) AS keep_id FROM round) AS d
+        WHERE r.id = d.id AND d.id <> d.keep_id
+    """)
+    # Sessions: prefer the one player is currently in, then the oldest
+    op.execute("""
+        DELETE FROM playersession AS s
+        USING (
+            SELECT id, first_value(id) OVER (PARTITION BY game_id, player_id ORDER BY state, id) AS keep_id
+            FROM playersession
+        ) AS d
+        WHERE s.id = d.id AND d.id <> d.keep_id
+    """)
+
+    # build indexes without locking writes out of hot tables
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,53 @@
+"""Add leaderboard projection
+
+Revision ID: 4c8e1f3a6b27
+Revises: 9d2c4a7f1b08
+Create Date: 2026-10-18 16:04:51.730264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8e1f3a6b27'
+down_revision = '9d2c4a7f1b08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('leaderboard',
+    sa.Column('player_id', sa.Integer(), nullable=False),
+    sa.Column('games_played', sa.Integer(), nullable=False),
+    sa.Column('wins', sa.Integer(), nullable=False),
+    sa.Column('winrate_bp', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['player_id'], ['player.id'], ),
+    sa.PrimaryKeyConstraint('player_id')
+    )
+
+    # backfill before indexing, same as refresh_leaderboard() of services.stats
+    op.execute("""
+        INSERT INTO leaderboard (player_id, games_played, wins, winrate_bp)
+        SELECT p.id, coalesce(s.games_played, 0), coalesce(s.games_won, 0),
+               coalesce(s.games_won * 10000 / nullif(s.games_played, 0), 0)
+        FROM player AS p
+        LEFT JOIN player_stats AS s ON s.player_id = p.id
+    """)
+
+    op.create_index('ix_leaderboard_games_played_player_id', 'leaderboard', ['games_played', 'player_id'], unique=False)
+    op.create_index('ix_leaderboard_winrate_bp_player_id', 'leaderboard', ['winrate_bp', 'player_id'], unique=False)
+
+    # elo is written in many places, it is sorted by on player itself
+    with op.get_context().autocommit_block():
+        op.create_index('ix_player_elo_id', 'player', ['elo', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_player_elo_id', table_name='player', postgresql_concurrently=True)
+
+    op.drop_index('ix_leaderboard_winrate_bp_player_id', table_name='leaderboard')
+    op.drop_index('ix_leaderboard_games_played_player_id', table_name='leaderboard')
+    op.drop_table('leaderboard')
@@ -0,0 +1,41 @@
+"""Add score to game
+
+Revision ID: 5e8a0c6d2f19
+Revises: b7d41e0a9c32
+Create Date: 2026-10-18 13:41:55.203417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8a0c6d2f19'
+down_revision = 'b7d41e0a9c32'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('game', sa.Column('score_a', sa.Integer(), server_default="0", nullable=False))
+    op.add_column('game', sa.Column('score_b', sa.Integer(), server_default="0", nullable=False))
+
+    op.execute("""
+        UPDATE game
+        SET score_a = s.score_a, score_b = s.score_b
+        FROM (
+            SELECT round.game_id,
+                   count(*) FILTER (WHERE round.winner_id = game.team_a_id) AS score_a,
+                   count(*) FILTER (WHERE round.winner_id = game.team_b_id) AS score_b
+            FROM round
+            JOIN game ON game.id = round.game_id
+            GROUP BY round.game_id
+        ) AS s
+        WHERE game.id = s.game_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('game', 'score_b')
+    op.drop_column('game', 'score_a')
@@ -0,0 +1,47 @@
+"""Add player session stats projection
+
+Revision ID: 7a3f5d2e9c41
+Revises: 4c8e1f3a6b27
+Create Date: 2026-10-18 17:12:38.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3f5d2e9c41'
+down_revision = '4c8e1f3a6b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('player_session_stats',
+    sa.Column('game_id', sa.Integer(), nullable=False),
+    sa.Column('player_id', sa.Integer(), nullable=False),
+    sa.Column('kills', sa.Integer(), nullable=False),
+    sa.Column('deaths', sa.Integer(), nullable=False),
+    sa.Column('assists', sa.Integer(), nullable=False),
+    sa.Column('hs', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['game_id'], ['game.id'], ),
+    sa.ForeignKeyConstraint(['player_id'], ['player.id'], ),
+    sa.PrimaryKeyConstraint('game_id', 'player_id')
+    )
+
+    # backfill from raw events, same as `python -m scripts.rebuild_player_stats`
+    op.execute("""
+        INSERT INTO player_session_stats (game_id, player_id, kills, deaths, assists, hs)
+        SELECT game_id, player_id,
+               count(*) FILTER (WHERE event = 'KILL'),
+               count(*) FILTER (WHERE event = 'DEATH'),
+               count(*) FILTER (WHERE event = 'ASSIST'),
+               count(*) FILTER (WHERE event = 'KILL' AND meta -> 'modifiers' ->> 'headshot' = 'true')
+        FROM gameplayerevent
+        GROUP BY game_id, player_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('player_session_stats')
@@ -0,0 +1,36 @@
+"""Add trigram index on player username
+
+Revision ID: 9d2c4a7f1b08
+Revises: 5e8a0c6d2f19
+Create Date: 2026-10-18 15:21:06.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2c4a7f1b08'
+down_revision = '5e8a0c6d2f19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_player_username_trgm',
+            'player',
+            ['username'],
+            postgresql_using='gin',
+            postgresql_ops={'username': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_player_username_trgm', table_name='player', postgresql_concurrently=True)
@@ -0,0 +1,68 @@
+"""Add player stats projection
+
+Revision ID: b7d41e0a9c32
+Revises: 3f1b2c9d7e4a
+Create Date: 2026-10-18 13:02:17.540981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41e0a9c32'
+down_revision = '3f1b2c9d7e4a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('player_stats',
+    sa.Column('player_id', sa.Integer(), nullable=False),
+    sa.Column('kills', sa.Integer(), nullable=False),
+    sa.Column('deaths', sa.Integer(), nullable=False),
+    sa.Column('assists', sa.Integer(), nullable=False),
+    sa.Column('hs', sa.Integer(), nullable=False),
+    sa.Column('games_played', sa.Integer(), nullable=False),
+    sa.Column('games_won', sa.Integer(), nullable=False),
+    sa.Column('ranked_games_played', sa.Integer(), nullable=False),
+    sa.Column('ranked_games_won', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['player_id'], ['player.id'], ),
+    sa.PrimaryKeyConstraint('player_id')
+    )
+
+    # backfill from raw events, same as `python -m scripts.rebuild_player_stats`
+    op.execute("""
+        INSERT INTO player_stats (player_id, kills, deaths, assists, hs,
+                                  games_played, games_won, ranked_games_played, ranked_games_won)
+        SELECT p.id,
+               coalesce(e.kills, 0), coalesce(e.deaths, 0), coalesce(e.assists, 0), coalesce(e.hs, 0),
+               coalesce(g.played, 0), coalesce(g.won, 0), coalesce(g.ranked_played, 0), coalesce(g.ranked_won, 0)
+        FROM player AS p
+        LEFT JOIN (
+            SELECT player_id,
+                   count(*) FILTER (WHERE event = 'KILL') AS kills,
+                   count(*) FILTER (WHERE event = 'DEATH') AS deaths,
+                   count(*) FILTER (WHERE event = 'ASSIST') AS assists,
+                   count(*) FILTER (WHERE event = 'KILL' AND meta -> 'modifiers' ->> 'headshot' = 'true') AS hs
+            FROM gameplayerevent
+            GROUP BY player_id
+        ) AS e ON e.player_id = p.id
+        LEFT JOIN (
+            SELECT s.player_id,
+                   count(*) AS played,
+                   count(*) FILTER (WHERE s.roster_id = game.winner_id) AS won,
+                   count(*) FILTER (WHERE game.mode = 5) AS ranked_played,
+                   count(*) FILTER (WHERE game.mode = 5 AND s.roster_id = game.winner_id) AS ranked_won
+            FROM playersession AS s
+            JOIN game ON game.id = s.game_id
+            WHERE s.roster_id IS NOT NULL AND game.status = 2
+            GROUP BY s.player_id
+        ) AS g ON g.player_id = p.id
+        WHERE e.player_id IS NOT NULL OR g.player_id IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('player_stats')
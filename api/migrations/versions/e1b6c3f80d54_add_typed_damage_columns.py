@@ -0,0 +1,86 @@
+"""Add typed damage columns to game player event
+
+Revision ID: e1b6c3f80d54
+Revises: 7a3f5d2e9c41
+Create Date: 2026-10-18 18:03:12.275640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b6c3f80d54'
+down_revision = '7a3f5d2e9c41'
+branch_labels = None
+depends_on = None
+
+
+# rows updated per transaction, so that backfill does not hold locks on the whole table
+BATCH_SIZE = 50_000
+
+# GamePlayerEvent.Modifier bits
+MODIFIERS = {
+    'headshot': 1,
+    'blinded': 2,
+    'wallbangPenalty': 4,
+}
+
+
+def _is_set(name):
+    return f"coalesce(meta -> 'modifiers' ->> '{name}', 'false') NOT IN ('false', '0', '0.0', '')"
+
+
+def upgrade() -> None:
+    op.create_table('damage_code',
+    sa.Column('id', sa.SmallInteger(), nullable=False),
+    sa.Column('kind', sqlmodel.sql.sqltypes.AutoString(length=16), nullable=False),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('uq_damage_code_kind_name', 'damage_code', ['kind', 'name'], unique=True)
+
+    op.add_column('gameplayerevent', sa.Column('modifiers', sa.SmallInteger(), server_default='0', nullable=False))
+    op.add_column('gameplayerevent', sa.Column('damage_source_id', sa.SmallInteger(), nullable=True))
+    op.add_column('gameplayerevent', sa.Column('damage_type_id', sa.SmallInteger(), nullable=True))
+    op.create_foreign_key(None, 'gameplayerevent', 'damage_code', ['damage_source_id'], ['id'])
+    op.create_foreign_key(None, 'gameplayerevent', 'damage_code', ['damage_type_id'], ['id'])
+
+    op.execute("""
+        INSERT INTO damage_code (kind, name)
+        SELECT DISTINCT 'source', meta ->> 'damage_source' FROM gameplayerevent WHERE meta ->> 'damage_source' IS NOT NULL
+        UNION
+        SELECT DISTINCT 'type', meta ->> 'damage_type' FROM gameplayerevent WHERE meta ->> 'damage_type' IS NOT NULL
+    """)
+
+    bounds = op.get_bind().execute(sa.text("SELECT min(id), max(id) FROM gameplayerevent")).first()
+    if bounds[0] is None:
+        return
+
+    modifiers = " | ".join(f"CASE WHEN {_is_set(name)} THEN {bit} ELSE 0 END" for name, bit in MODIFIERS.items())
+
+    # every batch is committed on its own
+    with op.get_context().autocommit_block():
+        for start in range(bounds[0], bounds[1] + 1, BATCH_SIZE):
+            op.execute(f"""
+                UPDATE gameplayerevent AS e
+                SET modifiers = {modifiers},
+                    damage_source_id = (
+                        SELECT id FROM damage_code WHERE kind = 'source' AND name = e.meta ->> 'damage_source'
+                    ),
+                    damage_type_id = (
+                        SELECT id FROM damage_code WHERE kind = 'type' AND name = e.meta ->> 'damage_type'
+                    )
+                WHERE e.id >= {start} AND e.id < {start + BATCH_SIZE}
+            """)
+
+
+def downgrade() -> None:
+    op.drop_constraint('gameplayerevent_damage_type_id_fkey', 'gameplayerevent', type_='foreignkey')
+    op.drop_constraint('gameplayerevent_damage_source_id_fkey', 'gameplayerevent', type_='foreignkey')
+    op.drop_column('gameplayerevent', 'damage_type_id')
+    op.drop_column('gameplayerevent', 'damage_source_id')
+    op.drop_column('gameplayerevent', 'modifiers')
+    op.drop_index('uq_damage_code_kind_name', table_name='damage_code')
+    op.drop_table('damage_code')
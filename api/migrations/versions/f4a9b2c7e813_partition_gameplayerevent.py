@@ -0,0 +1,132 @@
+"""Partition game player events by month
+
+Revision ID: f4a9b2c7e813
+Revises: e1b6c3f80d54
+Create Date: 2026-10-18 19:26:44.018337
+
+Existing table is renamed to gameplayerevent_legacy and new partitioned table takes its name,
+so that new events go to partitions right away. Rows are then copied over in batches,
+each committed on its own, and legacy table is dropped. Until the copy finishes
+older events are missing from the new table.
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a9b2c7e813'
+down_revision = 'e1b6c3f80d54'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 50_000
+
+# partitions are created up to this many months after current one, later ones by services.partitions
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, event, game_id, player_id, round_id, meta, is_ct, created_at, modifiers, damage_source_id, damage_type_id"
+
+INDEXES = ['ix_gameplayerevent_player_id_event', 'ix_gameplayerevent_game_id_player_id']
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_partition(month: date):
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS gameplayerevent_y{month.year}m{month.month:02d} PARTITION OF gameplayerevent "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    )
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE gameplayerevent RENAME TO gameplayerevent_legacy")
+    op.execute("ALTER INDEX gameplayerevent_pkey RENAME TO gameplayerevent_legacy_pkey")
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name.replace('gameplayerevent', 'gameplayerevent_legacy')}")
+
+    op.execute("""
+        CREATE TABLE gameplayerevent (
+            id INTEGER NOT NULL DEFAULT nextval('gameplayerevent_id_seq'),
+            event VARCHAR NOT NULL,
+            game_id INTEGER NOT NULL REFERENCES game (id),
+            player_id INTEGER NOT NULL REFERENCES player (id),
+            round_id INTEGER NOT NULL REFERENCES round (id),
+            meta JSON,
+            is_ct BOOLEAN NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            modifiers SMALLINT NOT NULL DEFAULT 0,
+            damage_source_id SMALLINT REFERENCES damage_code (id),
+            damage_type_id SMALLINT REFERENCES damage_code (id),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    # sequence would be dropped together with legacy table otherwise
+    op.execute("ALTER SEQUENCE gameplayerevent_id_seq OWNED BY gameplayerevent.id")
+
+    op.create_index('ix_gameplayerevent_player_id_event', 'gameplayerevent', ['player_id', 'event'], unique=False)
+    op.create_index('ix_gameplayerevent_game_id_player_id', 'gameplayerevent', ['game_id', 'player_id'], unique=False)
+
+    bind = op.get_bind()
+    first, min_id, max_id = bind.execute(sa.text(
+        "SELECT min(created_at), min(id), max(id) FROM gameplayerevent_legacy"
+    )).first()
+
+    current = datetime.now().date().replace(day=1)
+    month = first.date().replace(day=1) if first else current
+    while month <= _add_months(current, MONTHS_AHEAD):
+        _create_partition(month)
+        month = _add_months(month, 1)
+
+    if min_id is None:
+        op.execute("DROP TABLE gameplayerevent_legacy")
+        return
+
+    # events without timestamp predate it being set, put them at the start of the first partition
+    first_month = (first.date() if first else current).replace(day=1).isoformat()
+
+    with op.get_context().autocommit_block():
+        for start in range(min_id, max_id + 1, BATCH_SIZE):
+            op.execute(f"""
+                INSERT INTO gameplayerevent ({COLUMNS})
+                SELECT {COLUMNS.replace('created_at', f"coalesce(created_at, '{first_month}') AS created_at")}
+                FROM gameplayerevent_legacy
+                WHERE id >= {start} AND id < {start + BATCH_SIZE}
+            """)
+
+    op.execute("DROP TABLE gameplayerevent_legacy")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE gameplayerevent RENAME TO gameplayerevent_partitioned")
+    for name in ['gameplayerevent_pkey', *INDEXES]:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name.replace('gameplayerevent', 'gameplayerevent_partitioned')}")
+
+    op.execute("""
+        CREATE TABLE gameplayerevent (
+            id INTEGER NOT NULL DEFAULT nextval('gameplayerevent_id_seq') PRIMARY KEY,
+            event VARCHAR NOT NULL,
+            game_id INTEGER NOT NULL REFERENCES game (id),
+            player_id INTEGER NOT NULL REFERENCES player (id),
+            round_id INTEGER NOT NULL REFERENCES round (id),
+            meta JSON,
+            is_ct BOOLEAN NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE,
+            modifiers SMALLINT NOT NULL DEFAULT 0,
+            damage_source_id SMALLINT REFERENCES damage_code (id),
+            damage_type_id SMALLINT REFERENCES damage_code (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE gameplayerevent_id_seq OWNED BY gameplayerevent.id")
+    op.execute(f"INSERT INTO gameplayerevent ({COLUMNS}) SELECT {COLUMNS} FROM gameplayerevent_partitioned")
+    op.execute("DROP TABLE gameplayerevent_partitioned")
+
+    op.create_index('ix_gameplayerevent_player_id_event', 'gameplayerevent', ['player_id', 'event'], unique=False)
+    op.create_index('ix_gameplayerevent_game_id_player_id', 'gameplayerevent', ['game_id', 'player_id'], unique=False)
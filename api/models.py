@@ -1,45 +1,99 @@
 from __future__ import annotations
 
-import asyncio
 import json
 import logging
 import random
-from datetime import datetime
-from enum import IntEnum, Enum
-from typing import Union, Iterable, Optional, List, TypeVar, Type
+from datetime import datetime, timedelta
+from enum import IntEnum, Enum, IntFlag
+from typing import Union, Iterable, Optional, List, TypeVar, Type, ClassVar
 from uuid import UUID
 
-from sqlalchemy import DateTime, Column, or_
+from sqlalchemy import DateTime, Column, Index, or_, and_, SmallInteger, ForeignKey, Integer, event
 from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.ext.asyncio import create_async_engine, async_scoped_session
+from sqlalchemy.orm import sessionmaker, scoped_session, Session as OrmSession
 from sqlmodel import SQLModel, Field, Relationship, select, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession as SQLModelAsyncSession
 from sqlmodel.orm.session import Session as SQLModelSession
 
+from cache import LRUCache
+from constants import REFERENCE_CACHE_SIZE
 from events.schemas.bukkit import WinReason
+from metrics import instrument_engine, MeasuredQueuePool, MeasuredAsyncQueuePool
 from schemas.game import GamePlugin
-from schemas.permission import PType
+from schemas.permission import PType, PermissionTrie
 from settings import settings
+from unit_of_work import UnitOfWorkRegistry
 
 from schemas.common import ObjectId as ObjIdSchema
 
 engine = create_engine(
     settings.database_url,
-    pool_size=200,
-    max_overflow=0,
+    poolclass=MeasuredQueuePool,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
 )
 session_maker = sessionmaker(engine, expire_on_commit=False, class_=SQLModelSession)
 
-
-def scope():
-    return id(asyncio.current_task())
-
-
-def other_scope():
-    return id(asyncio.current_task())
-
-
-# GraphQLSession = scoped_session(session_maker, scopefunc=scope)
-Session = scoped_session(session_maker, scopefunc=other_scope)
+# asyncpg engine for paths that must not block the event loop while waiting on the database.
+# Relationship lazy loading does not work on async sessions, so anything walking
+# relationships (blazelink tables, MineStrike service) still goes through `Session`.
+async_engine = create_async_engine(
+    settings.async_database_url,
+    poolclass=MeasuredAsyncQueuePool,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+)
+async_session_maker = sessionmaker(async_engine, expire_on_commit=False, class_=SQLModelAsyncSession)
+
+# GraphQL views read from the replica when one is configured, see `services.replica`.
+# Without a replica these are the primary engines.
+if settings.database_replica_host:
+    replica_engine = create_engine(
+        settings.replica_database_url,
+        poolclass=MeasuredQueuePool,
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+    )
+    async_replica_engine = create_async_engine(
+        settings.async_replica_database_url,
+        poolclass=MeasuredAsyncQueuePool,
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+    )
+    instrument_engine(replica_engine)
+    instrument_engine(async_replica_engine.sync_engine)
+else:
+    replica_engine = engine
+    async_replica_engine = async_engine
+
+replica_session_maker = sessionmaker(replica_engine, expire_on_commit=False, class_=SQLModelSession)
+async_replica_session_maker = sessionmaker(async_replica_engine, expire_on_commit=False, class_=SQLModelAsyncSession)
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+
+# sessions are kept on the current unit of work instead of a scope key, see `unit_of_work`
+Session = scoped_session(session_maker)
+Session.registry = UnitOfWorkRegistry(session_maker, "sync")
+AsyncSession = async_scoped_session(async_session_maker, scopefunc=lambda: None)
+AsyncSession.registry = UnitOfWorkRegistry(async_session_maker, "async")
+
+# rows of rarely changing reference tables, see `ModelBase.cached`
+reference_cache = LRUCache(REFERENCE_CACHE_SIZE)
+
+
+def _load_reference(stmt, many=False):
+    """ Load rows with a session of their own, so that they stay usable detached in cache """
+    with session_maker() as session:
+        res = session.exec(stmt)
+        return tuple(res.all()) if many else res.first()
+
+
+def _attach(obj: T) -> T:
+    """ Copy of cached instance in current session, its relationships lazy load as usual """
+    return Session().merge(obj, load=False) if obj is not None else None
 
 
 class Location(IntEnum):
@@ -52,6 +106,8 @@ T = TypeVar("T", bound="ModelBase")
 
 
 class ModelBase(SQLModel):
+    # rows are served from `reference_cache`, invalidated when the table is written through the ORM
+    cached: ClassVar[bool] = False
 
     def objectId(self):
 
@@ -65,12 +121,27 @@ class ModelBase(SQLModel):
     def of(cls: Type[T], identifier: ObjIdSchema) -> T | None:
         if identifier is None:
             return None
-        print(f"{cls.__name__} of ({identifier.obj_id})")
+        if cls.cached:
+            return cls.cached_get(identifier.obj_id)
         return Session().exec(select(cls).where(cls.id == identifier.obj_id)).first()
 
+    @classmethod
+    def cached_get(cls: Type[T], pk) -> T | None:
+        obj = reference_cache.get((cls, str(pk)), lambda: _load_reference(select(cls).where(cls.id == pk)))
+        return _attach(obj)
+
+    @classmethod
+    async def async_of(cls: Type[T], identifier: ObjIdSchema) -> T | None:
+        """ Same as `of`, but loads instance through the async session.
+         Returned instance can't lazy load relationships. """
+        if identifier is None:
+            return None
+        return await AsyncSession().get(cls, identifier.obj_id)
+
 
 class PlayerPermission(ModelBase, table=True):
     __tablename__ = "player_permission"
+    cached: ClassVar[bool] = True
 
     id: int | None = Field(primary_key=True)
     name: str = Field(max_length=100)
@@ -88,8 +159,20 @@ class PlayerPermissions(ModelBase, table=True):
 class Player(ModelBase, table=True):
     """ Player in game / user on website """
 
+    __table_args__ = (
+        # substring and similarity search by username, needs pg_trgm extension
+        Index(
+            "ix_player_username_trgm",
+            "username",
+            postgresql_using="gin",
+            postgresql_ops={"username": "gin_trgm_ops"},
+        ),
+        # id breaks ties, so that keyset pagination by elo can follow the index
+        Index("ix_player_elo_id", "elo", "id"),
+    )
+
     id: int | None = Field(primary_key=True)
-    uuid: UUID | None = Field()
+    uuid: UUID | None = Field(index=True)
     team: Team = Relationship(back_populates="players", sa_relationship_kwargs={"foreign_keys": "Player.team_id"})
     team_id: int | None = Field(foreign_key="team.id", nullable=True)
     role: Role = Relationship()
@@ -265,6 +348,13 @@ class PlayerSession(ModelBase, table=True):
         IN_GAME = 0  # player is associated with this game
         AWAY = 1  # player once was in the game but left
 
+    __table_args__ = (
+        # player has exactly one session per game
+        Index("uq_playersession_game_id_player_id", "game_id", "player_id", unique=True),
+        # active session lookup
+        Index("ix_playersession_player_id_state", "player_id", "state"),
+    )
+
     id: int | None = Field(primary_key=True)
 
     player: Player = Relationship()
@@ -403,6 +493,7 @@ class MatchTeam(ModelBase, table=True):
 
 class MapTag(ModelBase, table=True):
     __tablename__ = "map_tag"
+    cached: ClassVar[bool] = True
 
     id: int = Field(primary_key=True)
     name: str = Field(max_length=32, unique=True)
@@ -417,6 +508,7 @@ class MapTags(ModelBase, table=True):
 
 
 class Map(ModelBase, table=True):
+    cached: ClassVar[bool] = True
 
     class Tag:
         Competitive = "competitive"
@@ -430,22 +522,22 @@ class Map(ModelBase, table=True):
     tags: List[MapTag] = Relationship(link_model=MapTags)
 
     @classmethod
-    def with_tag(cls, *tags: Map.Tag):
-        stmt = select(cls).where(
-            cls.tags.any(MapTag.name.in_(tags))
-        )
-        return Session().exec(stmt).all()
-
-    @classmethod
-    def random(cls, tags=None):
+    def _cached_with_tags(cls, tags) -> tuple[Map, ...]:
         stmt = select(cls)
         if tags:
             stmt = stmt.where(
                 cls.tags.any(MapTag.name.in_(tags))
             )
 
-        maps = Session().exec(stmt).all()
-        return random.choice(maps)
+        return reference_cache.get((cls, "tags", frozenset(tags or ())), lambda: _load_reference(stmt, many=True))
+
+    @classmethod
+    def with_tag(cls, *tags: Map.Tag):
+        return [_attach(game_map) for game_map in cls._cached_with_tags(tags)]
+
+    @classmethod
+    def random(cls, tags=None):
+        return _attach(random.choice(cls._cached_with_tags(tags)))
 
 
 class WhitelistedPlayer(ModelBase, table=True):
@@ -488,6 +580,10 @@ class Game(ModelBase, table=True):
         MAX_PLAYERS = "MAX_PLAYERS"
         AUTO_TEAM_BALANCE = "AUTO_TEAM_BALANCE"
 
+    __table_args__ = (
+        Index("ix_game_mode_status", "mode", "status"),
+    )
+
     id: int | None = Field(primary_key=True)
 
     map: Map = Relationship()
@@ -528,6 +624,14 @@ class Game(ModelBase, table=True):
 
     created_at: datetime = Field(default_factory=datetime.utcnow)
     started_at: datetime = Field(default=None, nullable=True)
+    finished_at: datetime = Field(default=None, nullable=True)
+
+    # raw events of the game were moved to cold storage, see `services.archive`
+    events_archived_at: datetime = Field(default=None, nullable=True)
+
+    # rounds won by each team, maintained by round win handler
+    score_a: int = Field(default=0)
+    score_b: int = Field(default=0)
 
     async def has_plugin(self, plugin: GamePlugin):
         return str(plugin) in self.plugins
@@ -632,14 +736,6 @@ class Game(ModelBase, table=True):
     def has_plugin(self, plugin):
         return self.plugins and plugin in self.plugins
 
-    @property
-    def score_a(self):
-        return Round.objects.filter(game=self, winner=self.team_a).count()
-
-    @property
-    def score_b(self):
-        return Round.objects.filter(game=self, winner=self.team_b).count()
-
 
 class Round(ModelBase, table=True):
     """
@@ -649,6 +745,10 @@ class Round(ModelBase, table=True):
         have to rely on round number assuming half is 15 rounds.
     """
 
+    __table_args__ = (
+        Index("uq_round_game_id_number", "game_id", "number", unique=True),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     game: Game = Relationship()
     game_id: int = Field(foreign_key="game.id")
@@ -658,6 +758,23 @@ class Round(ModelBase, table=True):
     winner_id: int = Field(foreign_key="in_game_team.id", nullable=True, default=None)
 
 
+class DamageCode(ModelBase, table=True):
+    """ Small integer code of weapon (damage source) or damage type name of GamePlayerEvent """
+
+    __tablename__ = "damage_code"
+
+    SOURCE: ClassVar[str] = "source"
+    TYPE: ClassVar[str] = "type"
+
+    __table_args__ = (
+        Index("uq_damage_code_kind_name", "kind", "name", unique=True),
+    )
+
+    id: int | None = Field(default=None, sa_column=Column(SmallInteger, primary_key=True))
+    kind: str = Field(max_length=16)
+    name: str = Field()
+
+
 class GamePlayerEvent(ModelBase, table=True):
     """
         Represents a player event in game, like kill,
@@ -672,7 +789,23 @@ class GamePlayerEvent(ModelBase, table=True):
         BOMB_PLANT = "BOMB_PLANT"
         BOMB_DEFUSE = "BOMB_DEFUSE"
 
-    id: int | None = Field(primary_key=True)
+    class Modifier(IntFlag):
+        """ Bits of `modifiers` column, keyed by names plugin uses in event modifiers """
+        headshot = 1
+        blinded = 2
+        wallbangPenalty = 4
+
+    __table_args__ = (
+        # player history
+        Index("ix_gameplayerevent_player_id_event", "player_id", "event"),
+        # game scoreboard
+        Index("ix_gameplayerevent_game_id_player_id", "game_id", "player_id"),
+        # monthly partitions are maintained by `services.partitions`
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    # partition key has to be part of primary key
+    id: int | None = Field(default=None, sa_column=Column(Integer, primary_key=True, autoincrement=True))
 
     # Event name
     event: GamePlayerEvent.Type = Field()
@@ -689,14 +822,94 @@ class GamePlayerEvent(ModelBase, table=True):
     round: Round = Relationship()
     round_id: int = Field(foreign_key="round.id")
 
-    # Meta
+    # Meta, fields queried by stats are also stored in typed columns below
     meta: dict = Field(sa_column=Column(JSON), default_factory=dict)
 
+    # GamePlayerEvent.Modifier flags
+    modifiers: int = Field(default=0, sa_column=Column(SmallInteger, nullable=False, default=0, server_default="0"))
+    damage_source_id: int | None = Field(
+        default=None,
+        sa_column=Column(SmallInteger, ForeignKey("damage_code.id"), nullable=True)
+    )
+    damage_type_id: int | None = Field(
+        default=None,
+        sa_column=Column(SmallInteger, ForeignKey("damage_code.id"), nullable=True)
+    )
+
     # Is player CT
     is_ct: bool = Field()
 
     # Timestamp
-    created_at: datetime = Field(default_factory=datetime.now, sa_column=Column(DateTime(timezone=True)))
+    created_at: datetime = Field(default_factory=datetime.now, sa_column=Column(DateTime(timezone=True), primary_key=True))
+
+    @classmethod
+    def of_game(cls, game: Game):
+        """
+            Condition selecting events of the game. Bounded by creation time of the game,
+            so that partitions of earlier months are pruned. A day of slack covers timezone mismatch.
+        """
+        return and_(cls.game_id == game.id, cls.created_at >= game.created_at - timedelta(days=1))
+
+
+class PlayerStats(ModelBase, table=True):
+    """
+        Aggregated player performance. Projection of GamePlayerEvent and PlayerSession
+        tables maintained by Bukkit event handlers, see `services.stats`.
+    """
+
+    __tablename__ = "player_stats"
+
+    player_id: int = Field(foreign_key="player.id", primary_key=True)
+
+    kills: int = Field(default=0)
+    deaths: int = Field(default=0)
+    assists: int = Field(default=0)
+    hs: int = Field(default=0)
+
+    # only finished games are counted
+    games_played: int = Field(default=0)
+    games_won: int = Field(default=0)
+    ranked_games_played: int = Field(default=0)
+    ranked_games_won: int = Field(default=0)
+
+
+class PlayerSessionStats(ModelBase, table=True):
+    """
+        Performance of player in one game, i.e. per PlayerSession, which is unique by (game_id, player_id).
+        Projection of GamePlayerEvent maintained by Bukkit event handlers, see `services.stats`.
+    """
+
+    __tablename__ = "player_session_stats"
+
+    game_id: int = Field(foreign_key="game.id", primary_key=True)
+    player_id: int = Field(foreign_key="player.id", primary_key=True)
+
+    kills: int = Field(default=0)
+    deaths: int = Field(default=0)
+    assists: int = Field(default=0)
+    hs: int = Field(default=0)
+
+
+class Leaderboard(ModelBase, table=True):
+    """
+        Sortable copy of player game results, refreshed when game ends, see `services.stats`.
+        Every player has a row, so that listings can join it without losing players.
+    """
+
+    __tablename__ = "leaderboard"
+
+    __table_args__ = (
+        # player id breaks ties, so that keyset pagination can follow indexes
+        Index("ix_leaderboard_games_played_player_id", "games_played", "player_id"),
+        Index("ix_leaderboard_winrate_bp_player_id", "winrate_bp", "player_id"),
+    )
+
+    player_id: int = Field(foreign_key="player.id", primary_key=True)
+
+    games_played: int = Field(default=0)
+    wins: int = Field(default=0)
+    # winrate in basis points, 10000 is 100%
+    winrate_bp: int = Field(default=0)
 
 
 class MapPick(ModelBase, table=True):
@@ -844,6 +1057,8 @@ class Event(ModelBase, table=True):
 
 
 class Role(ModelBase, table=True):
+    cached: ClassVar[bool] = True
+
     id: int | None = Field(primary_key=True)
 
     name: str = Field(max_length=100)
@@ -856,28 +1071,23 @@ class Role(ModelBase, table=True):
     team_override_color: bool = Field()
     permissions: List[PlayerPermission] = Relationship(link_model=PlayerPermissions)
 
-    def has_perm(self, perm: PType):
-        perm = perm.str()
-
-        for has_perm in self.permissions:
-            parts_present = has_perm.name.lower().split(".")
-            parts_required = perm.lower().split(".")
-            print(f"present: {parts_present}, required: {parts_required}")
-
-            # present permission is more specific than required
-            if len(parts_present) > len(parts_required):
-                continue
+    @classmethod
+    def by_name(cls, name: str) -> Role | None:
+        obj = reference_cache.get((cls, "name", name), lambda: _load_reference(select(cls).where(cls.name == name)))
+        return _attach(obj)
 
-            # iterate both lists and check if they match
-            for pres, req in zip(parts_present, parts_required):
-                if pres != req:
-                    if pres == "*":
-                        return True
-                    break
-            else:
-                return True
+    @classmethod
+    def permission_trie(cls, role_id: int) -> PermissionTrie:
+        """ Compiled permissions of the role, cached until permissions of any role change """
+        return reference_cache.get((cls, "permissions", role_id), lambda: PermissionTrie(_load_reference(
+            select(PlayerPermission.name)
+            .join(PlayerPermissions, onclause=PlayerPermissions.permission_id == PlayerPermission.id)
+            .where(PlayerPermissions.role_id == role_id),
+            many=True
+        )))
 
-        return False
+    def has_perm(self, perm: PType | str):
+        return self.permission_trie(self.id).grants(perm)
 
 
 class QueuePlayers(ModelBase, table=True):
@@ -984,7 +1194,7 @@ class AuthSession(ModelBase, table=True):
     player: Player = Relationship()
     player_id: int = Field(foreign_key="player.id", nullable=True, default=None)
 
-    session_key: str = Field(max_length=64)
+    session_key: str = Field(max_length=64, index=True)
     data: dict = Field(sa_column=Column(JSON), default_factory=dict)
 
     # def set_data(self, **data):
@@ -1021,3 +1231,54 @@ class AuthSession(ModelBase, table=True):
     def log_out(cls, player):
         AuthSession.objects.filter(player=player).delete()
         return
+
+
+# cached models whose entries are stale after a write to the table, link tables change cached relations
+CACHE_INVALIDATION = {
+    Map: (Map,),
+    MapTag: (MapTag, Map),
+    MapTags: (Map,),
+    Role: (Role,),
+    PlayerPermission: (PlayerPermission, Role),
+    PlayerPermissions: (Role,),
+}
+
+
+def _invalidated_by(session) -> set:
+    return {
+        group
+        for obj in [*session.new, *session.dirty, *session.deleted]
+        for group in CACHE_INVALIDATION.get(type(obj), ())
+    }
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _invalidate_reference_cache(session, flush_context):
+    # once more after commit, a concurrent miss could have loaded the rows before the transaction ended
+    groups = _invalidated_by(session)
+    session.info.setdefault("invalidated_reference_cache", set()).update(groups)
+    for group in groups:
+        reference_cache.invalidate(group)
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_reference_cache_after_commit(session):
+    for group in session.info.pop("invalidated_reference_cache", ()):
+        reference_cache.invalidate(group)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _forget_reference_cache_invalidation(session):
+    session.info.pop("invalidated_reference_cache", None)
+
+
+def warm_reference_cache():
+    """ Load all reference rows, so that first games and intents do not wait on them """
+    for model in (Map, MapTag, Role, PlayerPermission):
+        for obj in _load_reference(select(model), many=True):
+            reference_cache.put((model, str(obj.id)), obj)
+            if model is Role:
+                reference_cache.put((Role, "name", obj.name), obj)
+                Role.permission_trie(obj.id)
+
+    reference_cache.put((Map, "tags", frozenset()), _load_reference(select(Map), many=True))
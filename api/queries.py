@@ -1,32 +1,100 @@
 from __future__ import annotations
 
-
-from typing import Any
+import asyncio
+import inspect
+from functools import partial
+from typing import Any, Callable
 
 from blazelink import TableManager
 from blazelink.models import BlazeConfig, DataAccessor, BlazeContext, ScalarQuery, ListQuery, Table, computed, ObjectId, \
     Struct, VirtualTable, BlazeField, Page
-from sqlalchemy import func, case, and_
+from sqlalchemy import func, and_, or_, literal, inspect as sa_inspect
 from sqlalchemy.orm import aliased
 from sqlmodel import select, col
 
+from eager import plan_paths, loader_options
 from models import *
+from services.counters import online_players, active_games
+from services.ingestion import event_buffer
+from services.search import player_search_filter, player_search_order
+
+
+class AsyncBlazeContext(BlazeContext):
+    """
+        Blaze context that additionally carries async session used by data accessor,
+        and batch loaders and identity map shared by everything resolved within one GraphQL request.
+        Async session does not allow concurrent operations, resolvers take turns on `async_session_lock`.
+        Selection of the field being resolved is kept to plan eager loading, see `eager`.
+    """
+
+    def __init__(self, *args, async_session=None, async_session_lock: asyncio.Lock = None, loaders: dict = None,
+                 identity_map: dict = None, field_nodes: list = None, fragments: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.async_session = async_session
+        self.async_session_lock = async_session_lock or asyncio.Lock()
+        self.field_nodes = field_nodes or []
+        self.fragments = fragments or {}
+        # keyed by batch function or model, see `batched` and `SqlalchemyAccessor.get_by_pk`
+        self.loaders: dict[Any, BatchLoader] = {} if loaders is None else loaders
+        # (model, pk) -> instance loaded during this request
+        self.identity_map: dict[tuple[type, Any], Any] = {} if identity_map is None else identity_map
+
+    def eager_paths(self, model) -> frozenset[tuple[str, ...]]:
+        return plan_paths(model, self.field_nodes, self.fragments)
+
+    def eager_options(self, entity) -> list:
+        """ Loader options for relationships of the entity selected by the field being resolved """
+        return loader_options(entity, self.eager_paths(sa_inspect(entity).mapper.class_))
 
 
 class SqlalchemyAccessor(DataAccessor):
-
-    async def get_by_pk(self, context: BlazeContext, model, pk):
-        q = select(model).where(model.id == pk)
-        res = context.session.exec(q)
-        res = res.first()
-        return res
-
-    async def execute_query(self, context: BlazeContext, query) -> Any:
+    """
+        Loads rows through async session, so that waiting on database does not block event loop.
+        Loaded models are merged into sync session of the context, because table resolvers
+        lazy load relationships of returned models.
+    """
+
+    @staticmethod
+    def _attach(context: AsyncBlazeContext, obj):
+        if isinstance(obj, ModelBase):
+            return context.session.merge(obj, load=False)
+        return obj
+
+    async def _get_many(self, context: AsyncBlazeContext, model, paths: frozenset, pks: list) -> dict:
+        stmt = select(model).where(col(model.id).in_(pks)).options(*loader_options(model, paths))
+        async with context.async_session_lock:
+            rows = (await context.async_session.exec(stmt)).all()
+        # pk may come as string from object id, match them by string representation
+        loaded = {str(obj.id): self._attach(context, obj) for obj in rows}
+        return {pk: loaded.get(str(pk)) for pk in pks}
+
+    async def get_by_pk(self, context: AsyncBlazeContext, model, pk):
+        key = (model, str(pk))
+
+        if key not in context.identity_map:
+            # lookups of one model with same relationships selected within a tick are made by single query
+            paths = context.eager_paths(model)
+            loader_key = (model, paths)
+
+            if loader_key not in context.loaders:
+                context.loaders[loader_key] = BatchLoader(partial(self._get_many, context, model, paths))
+
+            context.identity_map[key] = await context.loaders[loader_key].load(pk)
+
+        return context.identity_map[key]
+
+    async def execute_query(self, context: AsyncBlazeContext, query) -> Any:
         if isinstance(query, ScalarQuery):
-            res = context.session.exec(query.query)
-            return res.scalar()
+            async with context.async_session_lock:
+                return (await context.async_session.execute(query.query)).scalar()
         elif isinstance(query, ListQuery):
-            return (context.session.exec(query.query)).all()
+            stmt = query.query
+            entity = stmt.column_descriptions[0]["entity"]
+            if isinstance(entity, type) and issubclass(entity, ModelBase):
+                stmt = stmt.options(*context.eager_options(entity))
+            async with context.async_session_lock:
+                rows = (await context.async_session.exec(stmt)).all()
+            return [self._attach(context, obj) for obj in rows]
         else:
             assert False
 
@@ -37,20 +105,156 @@ def context_factory(__info):
     request = __info.context.get("request")
     sess_id = request.headers.get('session_id')
     auth_id = request.headers.get('Authorization')
-    session = select(AuthSession).where(AuthSession.session_key == auth_id)
-    session = db.exec(session).first()
+    stmt = select(AuthSession).where(AuthSession.session_key == auth_id)
+    session = db.exec(stmt).first()
+    if session is None and auth_id:
+        # db may be the replica, which does not have sessions of players who have just logged in
+        session = Session().exec(stmt).first()
 
-    return BlazeContext(
+    return AsyncBlazeContext(
         user=session.player if session else None,
         request=request,
         session_id=sess_id,
-        session=db
+        session=db,
+        async_session=__info.context["async_database_session"],
+        async_session_lock=__info.context.setdefault("async_session_lock", asyncio.Lock()),
+        loaders=__info.context.setdefault("loaders", {}),
+        # only set for the duration of an operation, see `SessionExtension`. Contexts living longer
+        # (subscription refetches) get an empty map per resolution, so entities are never served stale.
+        identity_map=__info.context.get("identity_map"),
+        field_nodes=__info.field_nodes,
+        fragments=__info.fragments,
     )
 
 
 table_manager = TableManager(BlazeConfig(orm_class=float, data_accessor=SqlalchemyAccessor(), context_factory=context_factory))
 
 
+def _seek(keys: list[tuple[Any, bool]], values) -> Any:
+    """ Condition selecting rows that go after given values of keys in (key, descending) order """
+    clauses = []
+    for i, (key, desc) in enumerate(keys):
+        preceding_equal = [k == v for (k, _), v in zip(keys[:i], values)]
+        clauses.append(and_(*preceding_equal, key < values[i] if desc else key > values[i]))
+    return or_(*clauses)
+
+
+def paginate(context: AsyncBlazeContext, stmt, model, order: list[tuple[Any, bool]], after: int = None, first: int = None) -> list:
+    """
+        Execute statement selecting `model` ordered by given (expression, descending) keys.
+        Id of the model is always appended as the last key, so that order is total.
+        Relationships selected by the GraphQL field being resolved are eager loaded.
+
+        When `after` or `first` is given, returns at most `first` rows that go after row with id `after`.
+        Rows are sought in SQL by values of the order keys of that row, so that cost of a page
+        does not depend on how deep it is. Page after a row that is no longer in result set is empty,
+        so that a client following cursors does not start over from the first page.
+    """
+    session = context.session
+    order = [*order, (model.id, order[-1][1] if order else False)]
+
+    if after is None and first is None:
+        stmt = stmt.options(*context.eager_options(model))
+        return session.exec(stmt.order_by(*[key.desc() if desc else key.asc() for key, desc in order])).all()
+
+    keyed = stmt.add_columns(*[key.label(f"key_{i}") for i, (key, _) in enumerate(order)]).subquery()
+    keys = [(keyed.c[f"key_{i}"], desc) for i, (_, desc) in enumerate(order)]
+
+    entity = aliased(model, keyed)
+    page = (
+        select(entity)
+        .order_by(*[key.desc() if desc else key.asc() for key, desc in keys])
+        .options(*context.eager_options(entity))
+    )
+
+    if after is not None:
+        cursor = session.execute(select(*[key for key, _ in keys]).where(keys[-1][0] == after)).first()
+        if cursor is None:
+            return []
+        page = page.where(_seek(keys, cursor))
+
+    if first is not None:
+        page = page.limit(first)
+
+    return session.exec(page).all()
+
+
+class BatchLoader:
+    """
+        Collects keys requested during one event loop tick and resolves all of them
+        with single call of `batch_fn(keys) -> dict[key, value]`, batch function may be async.
+        Keys missing from the result resolve to `default`. Nothing is cached past the tick,
+        so values stay fresh when context outlives single resolution.
+    """
+
+    def __init__(self, batch_fn: Callable[[list], dict], default=None):
+        self.batch_fn = batch_fn
+        self.default = default
+        self._pending: dict[Any, asyncio.Future] = {}
+
+    def load(self, key) -> asyncio.Future:
+        if key in self._pending:
+            return self._pending[key]
+
+        loop = asyncio.get_running_loop()
+
+        # sibling list items resolve concurrently, dispatch once all of them asked for their keys
+        if not self._pending:
+            loop.call_soon(self._dispatch)
+
+        future = loop.create_future()
+        self._pending[key] = future
+        return future
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        asyncio.ensure_future(self._resolve(pending))
+
+    async def _resolve(self, pending: dict[Any, asyncio.Future]):
+        try:
+            results = self.batch_fn(list(pending))
+            if inspect.isawaitable(results):
+                results = await results
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # resolver that is no longer waiting (e.g. cancelled operation) must not fail the others
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(results.get(key, self.default))
+
+
+def batched(default=None):
+    """
+        Turn `fn(context, keys) -> dict[key, value]` into `await fn(context, key)`,
+        batching calls made by computed fields within one tick of the same request.
+    """
+
+    def decorator(fn):
+        async def load(context: AsyncBlazeContext, key):
+            if fn not in context.loaders:
+                context.loaders[fn] = BatchLoader(lambda keys: fn(context, keys), default)
+            return await context.loaders[fn].load(key)
+
+        return load
+
+    return decorator
+
+
+@batched(default=(0, 0))
+def player_results(context: AsyncBlazeContext, player_ids: list[int]) -> dict[int, tuple[int, int]]:
+    """ Games played and winrate per player, the same values player listings are sorted by """
+    stmt = (
+        select(Leaderboard.player_id, Leaderboard.games_played, Leaderboard.winrate_bp)
+        .where(col(Leaderboard.player_id).in_(player_ids))
+    )
+
+    return {player_id: (games, winrate) for player_id, games, winrate in context.session.exec(stmt).all()}
+
+
 @table_manager.table
 class TeamTable(Table[Team]):
     id: int
@@ -100,29 +304,14 @@ class PlayerTable(Table[Player]):
     permissions: list[PlayerPermissionTable]
 
     @computed
-    def games_played(self) -> int:
-
-        stmt = select(func.count(PlayerSession.id)).where(PlayerSession.player_id == self.get_model().id)
-        res = self.context.session.exec(stmt)
-        return res.first()
+    async def games_played(self) -> int:
+        games_played, _ = await player_results(self.context, self.get_model().id)
+        return games_played
 
     @computed
-    def winrate(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).where(PlayerSession.player_id == self.get_model().id)
-        res = self.context.session.exec(stmt)
-        total_games = res.first()
-
-        stmt = (
-                select(func.count(Game.id))
-                .join(PlayerSession)
-                .where(PlayerSession.roster_id == Game.winner_id)
-                .where(PlayerSession.player_id == self.get_model().id)
-        )
-
-        res = self.context.session.exec(stmt)
-        wins = res.first()
-
-        return int(wins / (total_games or 1) * 10000)
+    async def winrate(self) -> int:
+        _, winrate = await player_results(self.context, self.get_model().id)
+        return winrate
 
 
 @table_manager.table
@@ -267,22 +456,13 @@ class GameTable(Table[Game]):
     created_at: str
     started_at: str
 
+    score_a: int
+    score_b: int
+
     @computed
     def config(self) -> Config:
         return Config(json.dumps(self.get_model().config_overrides))
 
-    @computed
-    def score_a(self) -> int:
-        game_model = self.get_model()
-        stmt = select(func.count(Round.id)).where(Round.game_id == game_model.id, Round.winner_id == game_model.team_a_id)
-        return self.context.session.execute(stmt).scalar()
-
-    @computed
-    def score_b(self) -> int:
-        game_model = self.get_model()
-        stmt = select(func.count(Round.id)).where(Round.game_id == game_model.id, Round.winner_id == game_model.team_b_id)
-        return self.context.session.execute(stmt).scalar()
-
 
 @table_manager.type
 class PlayerStat(Struct):
@@ -305,89 +485,44 @@ class GameStatsView(VirtualTable):
     def __init__(self, identifier: ObjectId, context: BlazeContext):
         game_team_obj = identifier.find_dependency('InGameTeam')
         self.game_team_id = game_team_obj.obj_id
-        game_team = select(InGameTeam).where(InGameTeam.id == self.game_team_id)
-        game_team = context.session.exec(game_team).first()
-        self.game = game_team.game
 
     @computed
     def stats(self) -> list[PlayerStat]:
-        kill_counter = case(
-            [
-                (GamePlayerEvent.event == GamePlayerEvent.Type.KILL, 1),
-                (GamePlayerEvent.event != GamePlayerEvent.Type.KILL, 0)
-            ]
-        )
-        death_counter = case(
-            [
-                (GamePlayerEvent.event == GamePlayerEvent.Type.DEATH, 1),
-                (GamePlayerEvent.event != GamePlayerEvent.Type.DEATH, 0)
-            ]
-        )
-
-        assists_counter = case(
-            [
-                (GamePlayerEvent.event == GamePlayerEvent.Type.ASSIST, 1),
-                (GamePlayerEvent.event != GamePlayerEvent.Type.ASSIST, 0)
-            ]
-        )
-
-        hs_counter = case(
-            [
-                (GamePlayerEvent.meta['modifiers']['headshot'].astext == "true", 1),
-                (GamePlayerEvent.meta['modifiers']['headshot'].astext != "true", 0)
-            ]
-        )
-
         stmt = (
             select(
-                func.coalesce(func.sum(kill_counter), 0).label('kills'),
-                func.coalesce(func.sum(death_counter), 0).label('deaths'),
-                func.coalesce(func.sum(assists_counter), 0).label('assists'),
-                func.coalesce(func.sum(hs_counter), 0).label('hs'),
-                PlayerSession.player_id.label('player_id')
-            )
-            .select_from(InGameTeam)
-            .join(
-                PlayerSession,
-                onclause=PlayerSession.roster_id == InGameTeam.id
+                func.coalesce(PlayerSessionStats.kills, 0).label('kills'),
+                func.coalesce(PlayerSessionStats.deaths, 0).label('deaths'),
+                func.coalesce(PlayerSessionStats.assists, 0).label('assists'),
+                func.coalesce(PlayerSessionStats.hs, 0).label('hs'),
+                PlayerSession.game_id.label('game_id'),
+                Player,
             )
+            .select_from(PlayerSession)
+            .join(Player, onclause=Player.id == PlayerSession.player_id)
             .join(
-                GamePlayerEvent,
+                PlayerSessionStats,
                 isouter=True,
-                onclause=(
-                    and_(
-                        GamePlayerEvent.game_id == self.game.id,
-                        GamePlayerEvent.player_id == PlayerSession.player_id
-                    )
+                onclause=and_(
+                    PlayerSessionStats.game_id == PlayerSession.game_id,
+                    PlayerSessionStats.player_id == PlayerSession.player_id,
                 )
             )
-            .where(
-                InGameTeam.id == self.game_team_id,
-                or_(
-                    GamePlayerEvent.game_id == self.game.id,
-                    GamePlayerEvent.game_id == None,
-                )
-            )
-            .join(
-                Player,
-                onclause=Player.id == PlayerSession.player_id
-            )
-            .group_by(
-                PlayerSession.player_id
-            )
+            .where(PlayerSession.roster_id == self.game_team_id)
         )
 
-        stats = self.context.session.execute(stmt).all()
+        # from the primary, pending deltas leave the buffer once flushed there, replica may not have them yet
+        stats = Session().execute(stmt).all()
 
         stat_structs = []
         for stat in stats:
-            player = self.context.session.get(Player, stat.player_id)
+            # kills buffered for writing are not in the projection yet
+            pending = event_buffer.pending_session_stats(stat.game_id, stat.Player.id)
             stat = PlayerStat(
-                kills=stat.kills,
-                deaths=stat.deaths,
-                assists=stat.assists,
-                hs=stat.hs,
-                player=player
+                kills=stat.kills + pending["kills"],
+                deaths=stat.deaths + pending["deaths"],
+                assists=stat.assists + pending["assists"],
+                hs=stat.hs + pending["hs"],
+                player=stat.Player
             )
             stat.context = self.context
             stat_structs.append(stat)
@@ -404,7 +539,7 @@ class Server(VirtualTable):
     @computed
     async def games(self) -> list[GameTable]:
         stmt = select(Game).where(col(Game.status).not_in([Game.Status.FINISHED, Game.Status.TERMINATED]))
-        return (self.context.session.exec(stmt)).all()
+        return self.context.session.exec(stmt.options(*self.context.eager_options(Game))).all()
 
 
 @table_manager.table
@@ -436,10 +571,8 @@ class TopPlayersView(VirtualTable):
         pass
 
     @computed
-    async def players(self) -> Page[PlayerTable]:
-        stmt = select(Player).order_by(col(Player.elo).desc()).limit(10)
-        res = self.context.session.exec(stmt).all()
-        return res
+    async def players(self, after: int = None, first: int = 10) -> Page[PlayerTable]:
+        return paginate(self.context, select(Player), Player, [(col(Player.elo), True)], after, first)
 
 
 @table_manager.table
@@ -450,53 +583,43 @@ class GameModeStatsView(VirtualTable):
 
     @computed
     def ranked_online(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).join(Game).where(Game.mode == Game.Mode.RANKED, PlayerSession.state == PlayerSession.State.IN_GAME)
-        return self.context.session.exec(stmt).first()
+        return online_players(Game.Mode.RANKED)
 
     @computed
     def pubs_online(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).join(Game).where(Game.mode == Game.Mode.PUB, PlayerSession.state == PlayerSession.State.IN_GAME)
-        return self.context.session.exec(stmt).first()
+        return online_players(Game.Mode.PUB)
 
     @computed
     def duels_online(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).join(Game).where(Game.mode == Game.Mode.DUEL, PlayerSession.state == PlayerSession.State.IN_GAME)
-        return self.context.session.exec(stmt).first()
+        return online_players(Game.Mode.DUEL)
 
     @computed
     def deathmatch_online(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).join(Game).where(Game.mode == Game.Mode.DEATHMATCH, PlayerSession.state == PlayerSession.State.IN_GAME)
-        return self.context.session.exec(stmt).first()
+        return online_players(Game.Mode.DEATHMATCH)
 
     @computed
     def gungame_online(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).join(Game).where(Game.mode == Game.Mode.GUNGAME, PlayerSession.state == PlayerSession.State.IN_GAME)
-        return self.context.session.exec(stmt).first()
+        return online_players(Game.Mode.GUNGAME)
 
     @computed
     def ranked_games(self) -> int:
-        stmt = select(func.count(Game.id)).where(Game.mode == Game.Mode.RANKED, Game.status.in_([Game.Status.NOT_STARTED, Game.Status.STARTED]))
-        return self.context.session.exec(stmt).first()
+        return active_games(Game.Mode.RANKED)
 
     @computed
     def pubs_games(self) -> int:
-        stmt = select(func.count(Game.id)).where(Game.mode == Game.Mode.PUB, Game.status.in_([Game.Status.NOT_STARTED, Game.Status.STARTED]))
-        return self.context.session.exec(stmt).first()
+        return active_games(Game.Mode.PUB)
 
     @computed
     def duels_games(self) -> int:
-        stmt = select(func.count(Game.id)).where(Game.mode == Game.Mode.DUEL, Game.status.in_([Game.Status.NOT_STARTED, Game.Status.STARTED]))
-        return self.context.session.exec(stmt).first()
+        return active_games(Game.Mode.DUEL)
 
     @computed
     def deathmatch_games(self) -> int:
-        stmt = select(func.count(Game.id)).where(Game.mode == Game.Mode.DEATHMATCH, Game.status.in_([Game.Status.NOT_STARTED, Game.Status.STARTED]))
-        return self.context.session.exec(stmt).first()
+        return active_games(Game.Mode.DEATHMATCH)
 
     @computed
     def gungame_games(self) -> int:
-        stmt = select(func.count(Game.id)).where(Game.mode == Game.Mode.GUNGAME, Game.status.in_([Game.Status.NOT_STARTED, Game.Status.STARTED]))
-        return self.context.session.exec(stmt).first()
+        return active_games(Game.Mode.GUNGAME)
 
 
 @table_manager.table
@@ -532,7 +655,7 @@ class RankedView(VirtualTable):
     @computed
     def queues(self) -> list[QueueTable]:
         stmt = select(PlayerQueue).where(PlayerQueue.type == PlayerQueue.Type.RANKED).order_by(PlayerQueue.locked == True, col(PlayerQueue.id).desc()).limit(10)
-        return self.context.session.exec(stmt).all()
+        return self.context.session.exec(stmt.options(*self.context.eager_options(PlayerQueue))).all()
 
     @computed
     def my_queue(self) -> QueueTable:
@@ -549,12 +672,11 @@ class PubsView(VirtualTable):
     @computed
     def games(self) -> list[GameTable]:
         stmt = select(Game).where(Game.mode == Game.Mode.PUB, Game.status.in_([Game.Status.NOT_STARTED, Game.Status.STARTED]))
-        return self.context.session.exec(stmt).all()
+        return self.context.session.exec(stmt.options(*self.context.eager_options(Game))).all()
 
     @computed
     def online_player_count(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).join(Game).where(Game.mode == Game.Mode.PUB, PlayerSession.state == PlayerSession.State.IN_GAME)
-        return self.context.session.exec(stmt).first()
+        return online_players(Game.Mode.PUB)
 
 
 @table_manager.table
@@ -566,12 +688,11 @@ class GunGameView(VirtualTable):
     @computed
     def games(self) -> list[GameTable]:
         stmt = select(Game).where(Game.mode == Game.Mode.GUNGAME, Game.status.in_([Game.Status.NOT_STARTED, Game.Status.STARTED]))
-        return self.context.session.exec(stmt).all()
+        return self.context.session.exec(stmt.options(*self.context.eager_options(Game))).all()
 
     @computed
     def online_player_count(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).join(Game).where(Game.mode == Game.Mode.GUNGAME, PlayerSession.state == PlayerSession.State.IN_GAME)
-        return self.context.session.exec(stmt).first()
+        return online_players(Game.Mode.GUNGAME)
 
 
 @table_manager.table
@@ -583,12 +704,11 @@ class DeathMatchView(VirtualTable):
     @computed
     def games(self) -> list[GameTable]:
         stmt = select(Game).where(Game.mode == Game.Mode.DEATHMATCH, Game.status.in_([Game.Status.NOT_STARTED, Game.Status.STARTED]))
-        return self.context.session.exec(stmt).all()
+        return self.context.session.exec(stmt.options(*self.context.eager_options(Game))).all()
 
     @computed
     def online_player_count(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).join(Game).where(Game.mode == Game.Mode.DEATHMATCH, PlayerSession.state == PlayerSession.State.IN_GAME)
-        return self.context.session.exec(stmt).first()
+        return online_players(Game.Mode.DEATHMATCH)
 
 
 @table_manager.table
@@ -600,12 +720,11 @@ class DuelsView(VirtualTable):
     @computed
     def games(self) -> list[GameTable]:
         stmt = select(Game).where(Game.mode == Game.Mode.DUEL, Game.status.in_([Game.Status.NOT_STARTED, Game.Status.STARTED]))
-        return self.context.session.exec(stmt).all()
+        return self.context.session.exec(stmt.options(*self.context.eager_options(Game))).all()
 
     @computed
     def online_player_count(self) -> int:
-        stmt = select(func.count(PlayerSession.id)).join(Game).where(Game.mode == Game.Mode.DUEL, PlayerSession.state == PlayerSession.State.IN_GAME)
-        return self.context.session.exec(stmt).first()
+        return online_players(Game.Mode.DUEL)
 
 
 @table_manager.table
@@ -615,111 +734,31 @@ class PlayersView(VirtualTable):
         pass
 
     @computed
-    async def players(self, elo: int = None, games_played: int = None, winrate: int = None, query: str = None) -> Page[PlayerTable]:
+    async def players(self, elo: int = None, games_played: int = None, winrate: int = None, query: str = None,
+                      after: int = None, first: int = None) -> Page[PlayerTable]:
 
         stmt = select(Player)
+        order = []
 
-        if winrate is not None:
-            if winrate == -1:
-                stmt = stmt.group_by(Player.id).join(
-                    PlayerSession,
-                    isouter=True,
-                    onclause=PlayerSession.player_id == Player.id
-                ).join(
-                    Game,
-                    isouter=True,
-                ).order_by(
-                    func.coalesce(
-                        func.sum(
-                            case(
-                                [(Game.winner_id == PlayerSession.roster_id, 1)],
-                                else_=0
-                            ) * 100
-                        )
-                        /
-                        func.nullif(
-                            func.sum(
-                                case(
-                                    [(PlayerSession.roster_id != None, 1), ],
-                                    else_=0
-                                )
-                            ),
-                            0
-                        ),
-                        0
-                    ).desc()
-                )
-            elif winrate == 1:
-                stmt = stmt.group_by(Player.id).join(
-                    PlayerSession,
-                    isouter=True,
-                    onclause=PlayerSession.player_id == Player.id
-                ).join(
-                    Game,
-                    isouter=True,
-                ).order_by(
-                    func.coalesce(
-                        func.sum(
-                            case(
-                                [(Game.winner_id == PlayerSession.roster_id, 1)],
-                                else_=0
-                            ) * 100
-                        )
-                        /
-                        func.nullif(
-                            func.sum(
-                                case(
-                                    [(PlayerSession.roster_id != None, 1), ],
-                                    else_=0
-                                )
-                            ),
-                            0
-                        ),
-                        0
-                    ).asc()
-                )
+        # sort by precomputed columns, every player has a leaderboard row
+        if winrate in (1, -1) or games_played in (1, -1):
+            stmt = stmt.join(Leaderboard, onclause=Leaderboard.player_id == Player.id)
 
-        if games_played is not None:
+        if winrate in (1, -1):
+            order.append((col(Leaderboard.winrate_bp), winrate == -1))
 
-            if not winrate:
-                stmt = stmt.group_by(Player.id).join(PlayerSession, isouter=True, onclause=PlayerSession.player_id == Player.id)
+        if games_played in (1, -1):
+            order.append((col(Leaderboard.games_played), games_played == 1))
 
-            if games_played == 1:
-                stmt = stmt.order_by(
-                    func.sum(
-                        case(
-                            [
-                                (PlayerSession.id != None, 1),
-                            ],
-                            else_=0
-                        )
-                    ).desc()
-                )
-            elif games_played == -1:
-                stmt = stmt.order_by(
-                    func.sum(
-                        case(
-                            [
-                                (PlayerSession.id != None, 1),
-                            ],
-                            else_=0
-                        )
-                    ).asc()
-                )
-
-        if elo == 1:
-            stmt = stmt.order_by(col(Player.elo).desc())
-        elif elo == -1:
-            stmt = stmt.order_by(col(Player.elo).asc())
+        if elo in (1, -1):
+            order.append((col(Player.elo), elo == 1))
 
         if query:
-            stmt = stmt.where(
-                or_(
-                    col(Player.username).ilike(f'%{query}%'),
-                )
-            )
+            # explicitly requested sorts go first, relevance breaks their ties
+            stmt = stmt.where(player_search_filter(query))
+            order.extend(player_search_order(query))
 
-        return self.context.session.exec(stmt).all()
+        return paginate(self.context, stmt, Player, order, after, first)
 
 
 @table_manager.table
@@ -729,130 +768,43 @@ class PlayerPerformanceAggregatedView(VirtualTable):
         player_obj = identifier.find_dependency('Player')
         self.player_id = player_obj.obj_id
 
-        kill_counter = case(
-            [
-                (GamePlayerEvent.event == GamePlayerEvent.Type.KILL, 1),
-            ],
-            else_=0
-        )
-        death_counter = case(
-            [
-                (GamePlayerEvent.event == GamePlayerEvent.Type.DEATH, 1),
-            ],
-            else_=0
-        )
-
-        assists_counter = case(
-            [
-                (GamePlayerEvent.event == GamePlayerEvent.Type.ASSIST, 1),
-            ],
-            else_=0
-        )
-
-        hs_counter = case(
-            [
-                (
-                    and_(
-                        GamePlayerEvent.event == GamePlayerEvent.Type.KILL,
-                        GamePlayerEvent.meta['modifiers']['headshot'].astext == "true"
-                    ), 1
-                ),
-            ],
-            else_=0
-        )
-
-        stmt = (
-            select(
-                func.sum(kill_counter).label('kills'),
-                func.sum(death_counter).label('deaths'),
-                func.sum(assists_counter).label('assists'),
-                func.sum(hs_counter).label('hs'),
-            )
-            .select_from(GamePlayerEvent)
-            .where(
-                GamePlayerEvent.player_id == self.player_id,
-            )
-        )
-
-        self.stats = context.session.execute(stmt).first()
+        # projection row is missing until player's first event
+        # from the primary, same as `GameStatsView.stats`
+        self.stats = Session().get(PlayerStats, self.player_id) or PlayerStats(player_id=self.player_id)
+        # kills buffered for writing are not in the projection yet
+        self.pending = event_buffer.pending_player_stats(self.player_id)
 
     @computed
     async def kills(self) -> int:
-        return self.stats.kills or 0
+        return self.stats.kills + self.pending["kills"]
 
     @computed
     async def deaths(self) -> int:
-        return self.stats.deaths or 0
+        return self.stats.deaths + self.pending["deaths"]
 
     @computed
     async def assists(self) -> int:
-        return self.stats.assists or 0
+        return self.stats.assists + self.pending["assists"]
 
     @computed
     async def hs(self) -> int:
-        return self.stats.hs or 0
+        return self.stats.hs + self.pending["hs"]
 
     @computed
     async def games_played(self) -> int:
-        stmt = select(func.count(InGameTeam.id)).join(PlayerSession).where(
-            PlayerSession.player_id == self.player_id
-        )
-        return self.context.session.execute(stmt).scalar()
+        return self.stats.games_played
 
     @computed
     async def games_won(self) -> int:
-        stmt = (
-            select(func.count(InGameTeam.id)).join(PlayerSession)
-            .join(
-                Game,
-                onclause=or_(
-                    Game.team_a_id == InGameTeam.id,
-                    Game.team_b_id == InGameTeam.id,
-                )
-            )
-            .where(
-                Game.winner_id == InGameTeam.id,
-                PlayerSession.player_id == self.player_id,
-            )
-        )
-        return self.context.session.execute(stmt).scalar()
+        return self.stats.games_won
 
     @computed
     async def ranked_games_played(self) -> int:
-        stmt = (
-            select(func.count(InGameTeam.id)).join(PlayerSession)
-            .join(
-                Game,
-                onclause=or_(
-                    Game.team_a_id == InGameTeam.id,
-                    Game.team_b_id == InGameTeam.id,
-                )
-            )
-            .where(
-                PlayerSession.player_id == self.player_id,
-                Game.mode == Game.Mode.RANKED,
-            )
-        )
-        return self.context.session.execute(stmt).scalar()
+        return self.stats.ranked_games_played
 
     @computed
     async def ranked_games_won(self) -> int:
-        stmt = (
-            select(func.count(InGameTeam.id)).join(PlayerSession)
-            .join(
-                Game,
-                onclause=or_(
-                    Game.team_a_id == InGameTeam.id,
-                    Game.team_b_id == InGameTeam.id,
-                )
-            )
-            .where(
-                PlayerSession.player_id == self.player_id,
-                Game.mode == Game.Mode.RANKED,
-                Game.winner_id == InGameTeam.id,
-            )
-        )
-        return self.context.session.execute(stmt).scalar()
+        return self.stats.ranked_games_won
 
     @computed
     async def player(self) -> PlayerTable:
@@ -861,7 +813,7 @@ class PlayerPerformanceAggregatedView(VirtualTable):
         return player
 
     @computed
-    async def recent_games(self) -> Page[GameTable]:
+    async def recent_games(self, after: int = None, first: int = None) -> Page[GameTable]:
         team_a = aliased(InGameTeam)
         team_b = aliased(InGameTeam)
 
@@ -881,13 +833,12 @@ class PlayerPerformanceAggregatedView(VirtualTable):
                 )
             )
             .where(PlayerSession.player_id == self.player_id)
-            .order_by(col(Game.created_at).desc())
         )
 
-        return self.context.session.exec(stmt).all()
+        return paginate(self.context, stmt, Game, [(col(Game.created_at), True)], after, first)
 
     @computed
-    async def games(self, mode: str = None, won: bool = None) -> Page[GameTable]:
+    async def games(self, mode: str = None, won: bool = None, after: int = None, first: int = None) -> Page[GameTable]:
         team_a = aliased(InGameTeam)
         team_b = aliased(InGameTeam)
 
@@ -907,7 +858,6 @@ class PlayerPerformanceAggregatedView(VirtualTable):
                 )
             )
             .where(PlayerSession.player_id == self.player_id)
-            .order_by(col(Game.created_at).desc())
         )
 
         if mode:
@@ -919,7 +869,7 @@ class PlayerPerformanceAggregatedView(VirtualTable):
             else:
                 stmt = stmt.where(Game.winner_id != PlayerSession.roster_id)
 
-        return self.context.session.exec(stmt).all()
+        return paginate(self.context, stmt, Game, [(col(Game.created_at), True)], after, first)
 
 
 @table_manager.table
@@ -929,11 +879,10 @@ class GamesView(VirtualTable):
         pass
 
     @computed
-    async def games(self) -> Page[GameTable]:
-        # query all games newest to latest
-        stmt = (
-            select(Game)
-            .order_by(col(Game.started_at).is_(None), col(Game.started_at).desc(), col(Game.created_at).desc())
-        )
-
-        return self.context.session.exec(stmt).all()
+    async def games(self, after: int = None, first: int = None) -> Page[GameTable]:
+        # query all games newest to latest, not started games go last
+        order = [
+            (func.coalesce(Game.started_at, literal(datetime.min)), True),
+            (col(Game.created_at), True),
+        ]
+        return paginate(self.context, select(Game), Game, order, after, first)
@@ -2,7 +2,9 @@ from blazelink.schemas import IncomingEvent
 from fastapi import APIRouter
 
 from events.bukkit import BukkitEventManager
+from events.executor import ExecutorFull
 from dependencies import GetMineStrike
+from exceptions import UnavailableError
 
 router = APIRouter()
 
@@ -11,9 +13,13 @@ router = APIRouter()
 async def post_event(event: IncomingEvent, minestrike=GetMineStrike):
 
     print("received event", event.type, event.data)
-    response = await BukkitEventManager.propagate_abstract_event(
-        event, minestrike
-    )
+    try:
+        # events of one game are handled in order, events of different games concurrently
+        response = await BukkitEventManager.propagate_ordered_event(
+            event, minestrike
+        )
+    except ExecutorFull as e:
+        raise UnavailableError(str(e))
     print("sending response to event", event.type, response)
 
     return {
@@ -4,10 +4,11 @@ from typing import Optional
 from fastapi import APIRouter
 
 from dependencies import PlayerAuthDependency, GetMineStrike
-from models import Player, Match, Game, InGameTeam, PlayerSession, Round, GamePlayerEvent
+from models import Player, Match, Game, InGameTeam, PlayerSession, Round, GamePlayerEvent, Session
 from schemas.common import ApiResponse
 from schemas.game import CreateGame, JoinGame
-from exceptions import PermissionError, BadRequestError
+from exceptions import PermissionError, BadRequestError, NotFoundError
+from services.archive import game_events
 from services.game import find_team_for_player
 
 router = APIRouter()
@@ -168,3 +169,14 @@ async def join(data: JoinGame, player: Player = PlayerAuthDependency, minestrike
         roster=roster,
         status=PlayerSession.Status.PARTICIPATING
     )
+
+
+@router.get("/{game_id}/events")
+async def get_events(game_id: int):
+    """ Raw events of the game for match page deep dives, including archived games """
+    game = Session().get(Game, game_id)
+
+    if game is None:
+        raise NotFoundError("Game not found")
+
+    return await game_events(game)
@@ -36,3 +36,75 @@ def get_subscriptions():
     return {
         'subscriptions': data
     }
+
+
+@router.get("/ingestion")
+def get_ingestion():
+    from services.ingestion import event_buffer
+
+    return event_buffer.report()
+
+
+@router.get("/sessions")
+async def get_sessions():
+    from models import engine, async_engine
+    from unit_of_work import report
+
+    return report({"sync": engine, "async": async_engine.sync_engine})
+
+
+@router.get("/pool")
+async def get_pool():
+    from admission import admission_limiter
+    from metrics import pool_report
+    from models import engine, async_engine, replica_engine, async_replica_engine
+
+    report = {
+        "sync": pool_report(engine.pool),
+        "async": pool_report(async_engine.sync_engine.pool),
+        "admission": admission_limiter.report(),
+    }
+    if replica_engine is not engine:
+        report["replica_sync"] = pool_report(replica_engine.pool)
+        report["replica_async"] = pool_report(async_replica_engine.sync_engine.pool)
+    return report
+
+
+@router.get("/replica")
+async def get_replica():
+    from services.replica import replica_monitor
+
+    return replica_monitor.report()
+
+
+@router.get("/cache")
+async def get_cache():
+    from models import reference_cache
+
+    return reference_cache.report()
+
+
+@router.get("/waiters")
+async def get_waiters():
+    from events.bukkit import BukkitEventManager
+    from events.internal import internalHandler
+    from events.websocket import WsEventManager
+
+    return {
+        "bukkit": BukkitEventManager.report(),
+        "internal": internalHandler.report(),
+        "websocket": WsEventManager.report(),
+    }
+
+
+@router.get("/executors")
+async def get_executors():
+    from events.bukkit import BukkitEventManager
+    from events.internal import internalHandler
+    from events.websocket import WsEventManager
+
+    return {
+        "bukkit": BukkitEventManager.executor.report(),
+        "internal": internalHandler.executor.report(),
+        "websocket": WsEventManager.executor.report(),
+    }
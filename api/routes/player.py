@@ -14,6 +14,8 @@ from models import Player, Invite, Role, Session, \
     PlayerPermission, PlayerPermissions
 from adapters.mojang import get_last_name
 from schemas.player import SendInviteData
+from services import search
+from services.stats import refresh_leaderboard
 
 router = APIRouter()
 
@@ -63,8 +65,7 @@ async def get_or_create_player(uuid: UUID | None):
         res = Session().exec(stmt)
         player = res.first()
 
-    res = Session().exec(select(Role).where(Role.name == "default"))
-    role = res.first()
+    role = Role.by_name("default")
 
     if role is None:
         role = Role(
@@ -106,6 +107,8 @@ async def get_or_create_player(uuid: UUID | None):
         )
 
         Session().add(player)
+        Session().flush()
+        Session().execute(refresh_leaderboard(Player.id == player.id))
         Session().commit()
         Session().refresh(player)
 
@@ -129,7 +132,7 @@ async def get_player(uuid: UUID):
 
 @router.get("/find/{query}")
 def find_player(query: str):
-    player = Player.objects.filter(Q(username__iexact=query) | Q(uuid__iexact=query)).first()
+    player = search.find_player(query)
 
     player_id = player.id if player else None
 
@@ -1,19 +1,26 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
+from admission import admission, Priority
 from routes import roster, player, auth, event, match, game, bukkit, elo, queue
 
 
 def get_v1_router():
     v1_router = APIRouter()
 
-    v1_router.include_router(prefix="/roster", router=roster.router)
-    v1_router.include_router(prefix="/player", router=player.router)
-    v1_router.include_router(prefix="/auth", router=auth.router)
-    v1_router.include_router(prefix="/event", router=event.router)
-    v1_router.include_router(prefix="/match", router=match.router)
-    v1_router.include_router(prefix="/game", router=game.router)
-    v1_router.include_router(prefix="/bukkit", router=bukkit.router)
-    v1_router.include_router(prefix="/elo", router=elo.router)
-    v1_router.include_router(prefix="/queue", router=queue.router)
+    api_router = APIRouter(dependencies=[Depends(admission(Priority.NORMAL))])
+    api_router.include_router(prefix="/roster", router=roster.router)
+    api_router.include_router(prefix="/player", router=player.router)
+    api_router.include_router(prefix="/auth", router=auth.router)
+    api_router.include_router(prefix="/event", router=event.router)
+    api_router.include_router(prefix="/match", router=match.router)
+    api_router.include_router(prefix="/game", router=game.router)
+    api_router.include_router(prefix="/elo", router=elo.router)
+    api_router.include_router(prefix="/queue", router=queue.router)
+    v1_router.include_router(api_router)
+
+    # events of game servers are admitted even when the rest of the API sheds load
+    v1_router.include_router(prefix="/bukkit", router=bukkit.router, dependencies=[
+        Depends(admission(Priority.HIGH))
+    ])
     return v1_router
 
@@ -1,88 +1,111 @@
-from typing import Type
+from typing import Iterable
 
 
-class GetterProxy(type):
+class PType:
+    """
+        Permission, or group of permissions when its path ends with `*`.
+        Nodes are created once, when the tree is materialized at import, so that
+        `Permission.BMS.Games.Create` is a plain attribute lookup returning the same object every time.
+    """
 
-    def __getattribute__(self, item):
+    __slots__ = ('path', 'parts', '_str', '__dict__')
 
-        if item in ['children', 'path'] or item.startswith('_'):
-            return super().__getattribute__(item)
+    def __init__(self, path: tuple[str, ...]):
+        self.path = path
+        # lowercase parts, as matched against granted permissions
+        self.parts = tuple(part.lower() for part in path)
+        self._str = ".".join(path)
 
-        cls_name = self.__name__
+    def str(self) -> str:
+        return self._str
 
-        if cls_name == 'Permission':
-            path = []
-        else:
-            path = self.path
+    def __repr__(self):
+        return f"<PType {self._str}>"
 
-        if path and path[-1] == '*':
-            path = path[:-1]
 
-        next_path = path + [item]
+class PermissionGroup:
+    """ Declaration of permission group, nested groups are classes and permissions are annotations """
 
-        if hasattr(self, '_origclass') and hasattr(self._origclass, '__annotations__'):
-            ans = self._origclass.__annotations__
 
-            if item in ans:
-                o = new_perm_obj()
-                setattr(o, 'path', next_path)
-                return o
+def _materialize(group: type, path: tuple[str, ...] = ()) -> PType:
+    node = PType(path + ('*',))
 
-        cls = super().__getattribute__(item)
+    for name, value in vars(group).items():
+        if isinstance(value, type) and issubclass(value, PermissionGroup):
+            setattr(node, name, _materialize(value, path + (name,)))
 
-        if isinstance(cls, type):
-            next_path += ['*']
-            o = new_perm_obj(cls)
-            print(f"Create copy of {cls}: {o} {o._origname}")
-            setattr(o, 'path', next_path)
-            return o
+    for name in vars(group).get('__annotations__', {}):
+        setattr(node, name, PType(path + (name,)))
 
-        return cls
+    return node
 
 
-class PType(metaclass=GetterProxy):
-    _origname: str
-    _origclass: Type
-    path: list
+class PermissionTrie:
+    """
+        Permissions of a role compiled for lookup by parts of required permission.
 
-    @classmethod
-    def str(cls):
-        return ".".join(cls.path)
+        Granted permission covers required one if it is its prefix, e.g. `bms.games` covers `bms.games.create`,
+        or if it matches up to a `*`, e.g. `bms.*` covers `bms.games.create` and `*` covers everything.
+        Granted permission longer than required one does not cover it.
+    """
 
+    __slots__ = ('children', 'granted', 'shortest')
 
-def new_perm_obj(cls=None) -> Type[PType]:
+    def __init__(self, permissions: Iterable[str] = ()):
+        self.children: dict[str, PermissionTrie] = {}
+        self.granted = False
+        # number of parts of the shortest permission going through this node
+        self.shortest = None
 
-    if cls:
-        class Copy(cls, PType):
-            pass
+        for permission in permissions:
+            self._add(permission.lower().split("."))
 
-        setattr(Copy, '_origname', cls.__name__)
-        setattr(Copy, '_origclass', cls)
+    def _add(self, parts: list[str]):
+        node = self
+        for part in parts:
+            node = node.children.setdefault(part, PermissionTrie())
+            node.shortest = len(parts) if node.shortest is None else min(node.shortest, len(parts))
+        node.granted = True
 
-        return Copy
-    else:
-        class Copy(PType):
-            pass
-        return Copy
+    def grants(self, perm: PType | str) -> bool:
+        parts = perm.parts if isinstance(perm, PType) else perm.lower().split(".")
+        node = self
 
+        for part in parts:
+            if node.granted:
+                return True
 
-class Permission(PType):
+            wildcard = node.children.get('*')
+            if part != '*' and wildcard is not None and wildcard.shortest <= len(parts):
+                return True
 
-    class BMS(PType):
-        class Games(PType):
-            class Ranked(PType):
+            node = node.children.get(part)
+            if node is None:
+                return False
+
+        return node.granted
+
+
+class Permission(PermissionGroup):
+
+    class BMS(PermissionGroup):
+        class Games(PermissionGroup):
+            class Ranked(PermissionGroup):
                 Create: PType
 
-            class Manager(PType):
+            class Manager(PermissionGroup):
                 Whitelist: PType
                 Blacklist: PType
 
             Create: PType
 
-        class Permission(PType):
+        class Permission(PermissionGroup):
             Create: PType
             Grant: PType
             Revoke: PType
 
-        class Match(PType):
+        class Match(PermissionGroup):
             Create: PType
+
+
+Permission: PType = _materialize(Permission)
@@ -0,0 +1,95 @@
+"""
+    Measures intent latency while backend is flooded with concurrent Bukkit events.
+
+    Fires `--events` PlayerDeathEvent requests at once and, while they are being handled,
+    sends `--intents` PlayerGenerateCodeIntent requests one by one, reporting their latency percentiles.
+    Run it against backend before and after a change to compare.
+
+    Backend has to have MineStrike connected, otherwise bukkit route responds with 503.
+
+    Usage (from api directory):
+        python -m scripts.bench_bukkit_events --game 1 --damagee 1 --damager 2 --player 1
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def object_id(entity: str, obj_id: int | None):
+    if obj_id is None:
+        return None
+    return {"obj_id": obj_id, "entity": entity, "dependencies": []}
+
+
+async def post_event(http: aiohttp.ClientSession, url: str, event_type: str, data: dict) -> float:
+    started = time.perf_counter()
+    async with http.post(url, json={"type": event_type, "data": data}) as resp:
+        await resp.read()
+        resp.raise_for_status()
+    return (time.perf_counter() - started) * 1000
+
+
+async def flood(http, url, args):
+    data = {
+        "damagee": object_id("Player", args.damagee),
+        "damager": object_id("Player", args.damager),
+        "game": object_id("Game", args.game),
+        "damageSource": "AK-47",
+        "modifiers": {"headshot": False},
+        "reason": "GUN",
+        "round": args.round,
+    }
+    return await asyncio.gather(*[post_event(http, url, "PlayerDeathEvent", data) for _ in range(args.events)])
+
+
+async def intents(http, url, args):
+    data = {"player": object_id("Player", args.player)}
+    latencies = []
+    for _ in range(args.intents):
+        latencies.append(await post_event(http, url, "PlayerGenerateCodeIntent", data))
+    return latencies
+
+
+def report(name: str, latencies: list[float]):
+    print(
+        f"{name:<8} n={len(latencies):<5} "
+        f"mean={statistics.mean(latencies):8.2f}ms "
+        f"p50={percentile(latencies, 50):8.2f}ms "
+        f"p99={percentile(latencies, 99):8.2f}ms "
+        f"max={max(latencies):8.2f}ms"
+    )
+
+
+async def main(args):
+    url = args.url.rstrip("/") + "/api/bukkit/event"
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as http:
+        events, intent_latencies = await asyncio.gather(flood(http, url, args), intents(http, url, args))
+
+    report("events", events)
+    report("intents", intent_latencies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--game", type=int, required=True)
+    parser.add_argument("--damagee", type=int, required=True)
+    parser.add_argument("--damager", type=int, default=None)
+    parser.add_argument("--player", type=int, required=True, help="player that sends intents")
+    parser.add_argument("--round", type=int, default=1)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--intents", type=int, default=50)
+
+    asyncio.run(main(parser.parse_args()))
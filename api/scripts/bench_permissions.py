@@ -0,0 +1,79 @@
+"""
+    Microbenchmark of permission checks.
+
+    Compares compiled `PermissionTrie` lookups against the linear scan `Role.has_perm` used to do,
+    for a role with `--permissions` granted permissions, and checks both agree on every case.
+    Required permissions are given both as strings and as `Permission` constants, the latter
+    includes cost of resolving the constant.
+
+    Usage (from api directory):
+        python -m scripts.bench_permissions --permissions 50
+"""
+
+import argparse
+import random
+import timeit
+
+from schemas.permission import PermissionTrie, Permission
+
+
+def linear_has_perm(granted: list[str], perm: str) -> bool:
+    """ Check as done by `Role.has_perm` before permissions were compiled """
+    for has_perm in granted:
+        parts_present = has_perm.lower().split(".")
+        parts_required = perm.lower().split(".")
+
+        if len(parts_present) > len(parts_required):
+            continue
+
+        for pres, req in zip(parts_present, parts_required):
+            if pres != req:
+                if pres == "*":
+                    return True
+                break
+        else:
+            return True
+
+    return False
+
+
+def granted_permissions(count: int) -> list[str]:
+    words = ["bms", "games", "manager", "ranked", "match", "team", "api", "chat", "queue", "map"]
+    granted = {"bms.games.create", "chat.*"}
+    while len(granted) < count:
+        granted.add(".".join(random.choices(words, k=random.randint(2, 4))))
+    return sorted(granted)
+
+
+def report(name: str, stmt, number: int):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5))
+    print(f"{name:<32} {seconds / number * 1e9:>10.0f} ns/check")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--permissions", type=int, default=50)
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    granted = granted_permissions(args.permissions)
+    trie = PermissionTrie(granted)
+
+    required = {
+        "granted": "bms.games.create",
+        "denied": "bms.games.manager.blacklist",
+        "wildcard": "chat.color.red",
+    }
+
+    for name, perm in required.items():
+        assert trie.grants(perm) == linear_has_perm(granted, perm), name
+
+        report(f"linear {name}", lambda: linear_has_perm(granted, perm), args.number)
+        report(f"trie {name}", lambda: trie.grants(perm), args.number)
+
+    report("linear constant", lambda: linear_has_perm(granted, Permission.BMS.Games.Manager.Blacklist.str()), args.number)
+    report("trie constant", lambda: trie.grants(Permission.BMS.Games.Manager.Blacklist), args.number)
+
+    # compilation happens once per role, after its permissions change
+    report("compile", lambda: PermissionTrie(granted), args.number // 100)
@@ -0,0 +1,45 @@
+"""
+    Manages monthly partitions of game events table.
+
+    Usage (from api directory):
+        python -m scripts.event_partitions list
+        python -m scripts.event_partitions ensure --ahead 3
+        python -m scripts.event_partitions detach --before 2026-01
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+
+from models import async_session_maker
+from services.partitions import list_event_partitions, ensure_event_partitions, detach_event_partitions
+
+
+async def main(args):
+    if args.command == "ensure":
+        await ensure_event_partitions(args.ahead)
+
+    elif args.command == "detach":
+        before = datetime.strptime(args.before, "%Y-%m").date()
+        for name in await detach_event_partitions(before):
+            print(f"detached {name}")
+        return
+
+    async with async_session_maker() as session:
+        for month, name in sorted((await list_event_partitions(session)).items()):
+            print(f"{month:%Y-%m}  {name}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="list attached partitions")
+
+    ensure = commands.add_parser("ensure", help="create partitions up to given number of months ahead")
+    ensure.add_argument("--ahead", type=int, default=3)
+
+    detach = commands.add_parser("detach", help="archive events of partitions of months before given one and detach them")
+    detach.add_argument("--before", required=True, help="YYYY-MM")
+
+    asyncio.run(main(parser.parse_args()))
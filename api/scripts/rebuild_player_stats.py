@@ -0,0 +1,26 @@
+"""
+    Recomputes player_stats, player_session_stats and leaderboard projections from raw game events and sessions.
+    Events of archived games are read from their archive files.
+    Events ingested while it runs are lost from the projection, so run it when no games are played.
+
+    Usage (from api directory):
+        python -m scripts.rebuild_player_stats
+"""
+
+from models import Session
+from services.archive import archived_session_stats
+from services.stats import rebuild_player_stats
+
+
+def main():
+    archived = archived_session_stats(Session())
+
+    for stmt in rebuild_player_stats(archived):
+        Session().execute(stmt)
+
+    Session().commit()
+    print("player_stats rebuilt")
+
+
+if __name__ == '__main__':
+    main()
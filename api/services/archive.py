@@ -0,0 +1,202 @@
+"""
+    Cold storage of raw events of finished games.
+
+    Events of games finished more than `EVENT_ARCHIVE_RETENTION_DAYS` ago are written to
+    `<events_archive_dir>/<game_id // 1000>/<game_id>.parquet` and deleted from the database.
+    Aggregated projections are kept, so scoreboards and profiles do not need archived events.
+    `game_events` reads events of a game from wherever they are stored.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import traceback
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import delete, update, func
+from sqlmodel import select, col
+
+from constants import EVENT_ARCHIVE_RETENTION_DAYS, EVENT_ARCHIVE_BATCH, EVENT_ARCHIVE_INTERVAL
+from models import Game, GamePlayerEvent, async_session_maker
+from settings import settings
+
+SCHEMA = pa.schema([
+    ("id", pa.int32()),
+    ("event", pa.string()),
+    ("game_id", pa.int32()),
+    ("player_id", pa.int32()),
+    ("round_id", pa.int32()),
+    # JSON text
+    ("meta", pa.string()),
+    ("is_ct", pa.bool_()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+    ("modifiers", pa.int16()),
+    ("damage_source_id", pa.int16()),
+    ("damage_type_id", pa.int16()),
+])
+
+
+def archive_path(game_id: int) -> Path:
+    return Path(settings.events_archive_dir) / str(game_id // 1000) / f"{game_id}.parquet"
+
+
+def _to_row(event: GamePlayerEvent) -> dict:
+    row = {name: getattr(event, name) for name in SCHEMA.names}
+    row["event"] = GamePlayerEvent.Type(event.event).value
+    row["meta"] = json.dumps(event.meta) if event.meta is not None else None
+    return row
+
+
+def _from_row(row: dict) -> GamePlayerEvent:
+    return GamePlayerEvent(**{
+        **row,
+        "event": GamePlayerEvent.Type(row["event"]),
+        "meta": json.loads(row["meta"]) if row["meta"] is not None else None,
+    })
+
+
+def _write(path: Path, rows: list[dict]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(pa.Table.from_pylist(rows, schema=SCHEMA), tmp, compression="zstd")
+    # file is either complete or missing
+    os.replace(tmp, path)
+
+
+def _read(path: Path) -> list[dict]:
+    if not path.exists():
+        return []
+    return pq.read_table(path).to_pylist()
+
+
+def _merge(archived: list[dict], events: list[GamePlayerEvent]) -> list[dict]:
+    """ Rows of archive file with given events added, file may already hold some of them """
+    known = {row["id"] for row in archived}
+    return archived + [_to_row(event) for event in events if event.id not in known]
+
+
+async def game_events(game: Game) -> list[GamePlayerEvent]:
+    """ Events of the game ordered by id, read from archive if game was archived """
+    if game.events_archived_at is not None:
+        rows = await asyncio.to_thread(_read, archive_path(game.id))
+        return [_from_row(row) for row in rows]
+
+    async with async_session_maker() as session:
+        stmt = select(GamePlayerEvent).where(GamePlayerEvent.of_game(game)).order_by(GamePlayerEvent.id)
+        events = (await session.exec(stmt)).all()
+
+    # archiving that did not finish moved some of the events already
+    rows = await asyncio.to_thread(_read, archive_path(game.id))
+    if not rows:
+        return events
+
+    stored = {event.id for event in events}
+    archived = [_from_row(row) for row in rows if row["id"] not in stored]
+    return sorted([*archived, *events], key=lambda event: event.id)
+
+
+def archived_session_stats(session) -> list[dict]:
+    """ Per session stats of events in archive files, in format of PlayerSessionStats rows. Blocking """
+    archived_ids = set(session.exec(select(Game.id).where(Game.events_archived_at != None)).all())
+    stats = []
+
+    for path in sorted(Path(settings.events_archive_dir).glob("*/*.parquet")):
+        game_id = int(path.stem)
+        players: dict[int, Counter] = defaultdict(Counter)
+
+        # archiving of the game did not finish, events it did not delete are counted from the database
+        stored = set()
+        if game_id not in archived_ids:
+            stored = set(session.exec(select(GamePlayerEvent.id).where(GamePlayerEvent.game_id == game_id)).all())
+
+        for row in _read(path):
+            if row["id"] in stored:
+                continue
+
+            event = GamePlayerEvent.Type(row["event"])
+            counter = players[row["player_id"]]
+
+            if event == GamePlayerEvent.Type.KILL:
+                counter["kills"] += 1
+                counter["hs"] += int(bool(row["modifiers"] & GamePlayerEvent.Modifier.headshot))
+            elif event == GamePlayerEvent.Type.DEATH:
+                counter["deaths"] += 1
+            elif event == GamePlayerEvent.Type.ASSIST:
+                counter["assists"] += 1
+
+        stats.extend({"game_id": game_id, "player_id": player_id, **counter} for player_id, counter in players.items())
+
+    return stats
+
+
+async def archive_game(game: Game) -> bool:
+    """
+        Move all events of the game to archive file. Game is marked archived only once none of its
+        events are left in the database, returns whether it was.
+    """
+    path = archive_path(game.id)
+
+    async with async_session_maker() as session:
+        # not bounded by time like `GamePlayerEvent.of_game`, nothing may stay behind
+        of_game = GamePlayerEvent.game_id == game.id
+
+        events = (await session.exec(select(GamePlayerEvent).where(of_game).order_by(GamePlayerEvent.id))).all()
+
+        if events:
+            # file of an earlier attempt holds events that are already deleted
+            archived = await asyncio.to_thread(_read, path)
+            await asyncio.to_thread(_write, path, _merge(archived, events))
+
+            await session.execute(delete(GamePlayerEvent).where(of_game, GamePlayerEvent.id <= events[-1].id))
+
+        left = (await session.execute(select(func.count()).select_from(GamePlayerEvent).where(of_game))).scalar()
+        if not left:
+            await session.execute(update(Game).where(Game.id == game.id).values(events_archived_at=datetime.now()))
+
+        await session.commit()
+
+    if left:
+        logging.warning(f"Archived {len(events)} events of game {game.id}, {left} arrived meanwhile")
+    else:
+        logging.info(f"Archived {len(events)} events of game {game.id}")
+
+    return not left
+
+
+async def archive_finished_games(limit: int = EVENT_ARCHIVE_BATCH) -> int:
+    """ Archive events of games finished before retention window, returns number of archived games """
+    threshold = datetime.now() - timedelta(days=EVENT_ARCHIVE_RETENTION_DAYS)
+
+    async with async_session_maker() as session:
+        stmt = (
+            select(Game)
+            .where(
+                col(Game.status).in_([Game.Status.FINISHED, Game.Status.TERMINATED]),
+                Game.events_archived_at == None,
+                func.coalesce(Game.finished_at, Game.created_at) < threshold,
+            )
+            .order_by(Game.id)
+            .limit(limit)
+        )
+        games = (await session.exec(stmt)).all()
+
+    for game in games:
+        await archive_game(game)
+
+    return len(games)
+
+
+async def archive_finished_games_periodically():
+    while True:
+        try:
+            await archive_finished_games()
+        except Exception:
+            logging.error("Failed to archive game events")
+            traceback.print_exc()
+
+        await asyncio.sleep(EVENT_ARCHIVE_INTERVAL)
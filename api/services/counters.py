@@ -0,0 +1,86 @@
+"""
+    In-process counters of games per (mode, status) and player sessions per (mode, state).
+
+    Code paths changing game status or session state update them after committing,
+    so that views can read online/active counts without querying the database.
+    Counters are periodically reconciled against the database to fix any drift.
+    They are per-process, running several API workers requires sharing them elsewhere.
+"""
+
+import asyncio
+import logging
+import traceback
+from collections import defaultdict
+
+from sqlalchemy import func
+from sqlmodel import select
+
+from constants import COUNTERS_RECONCILE_INTERVAL
+from models import Game, PlayerSession, AsyncSession
+from unit_of_work import unit_of_work
+
+
+class Counter:
+
+    def __init__(self, name: str):
+        self.name = name
+        self._counts: dict[tuple, int] = defaultdict(int)
+
+    def get(self, key: tuple) -> int:
+        return max(0, self._counts.get(key, 0))
+
+    def add(self, key: tuple, delta: int = 1):
+        self._counts[key] += delta
+
+    def move(self, old_key: tuple, new_key: tuple):
+        """ Move one item from one key to another, e.g. when game changes status """
+        if old_key == new_key:
+            return
+        self.add(old_key, -1)
+        self.add(new_key, 1)
+
+    def reset(self, counts: dict[tuple, int]):
+        self._counts = defaultdict(int, counts)
+
+
+# keyed by (Game.Mode, Game.Status)
+game_counter = Counter("games")
+
+# keyed by (Game.Mode, PlayerSession.State)
+session_counter = Counter("sessions")
+
+
+def active_games(mode: Game.Mode) -> int:
+    return game_counter.get((mode, Game.Status.NOT_STARTED)) + game_counter.get((mode, Game.Status.STARTED))
+
+
+def online_players(mode: Game.Mode) -> int:
+    return session_counter.get((mode, PlayerSession.State.IN_GAME))
+
+
+async def reconcile_counters():
+    """ Recount everything from the database """
+    games = select(Game.mode, Game.status, func.count(Game.id)).group_by(Game.mode, Game.status)
+    sessions = (
+        select(Game.mode, PlayerSession.state, func.count(PlayerSession.id))
+        .join(Game, onclause=Game.id == PlayerSession.game_id)
+        .group_by(Game.mode, PlayerSession.state)
+    )
+
+    game_counts = (await AsyncSession().execute(games)).all()
+    session_counts = (await AsyncSession().execute(sessions)).all()
+
+    game_counter.reset({(mode, status): count for mode, status, count in game_counts})
+    session_counter.reset({(mode, state): count for mode, state, count in session_counts})
+
+
+async def reconcile_counters_periodically():
+    while True:
+        try:
+            async with unit_of_work("reconcile counters"):
+                await reconcile_counters()
+        except Exception:
+            logging.error("Failed to reconcile counters")
+            traceback.print_exc()
+
+        await asyncio.sleep(COUNTERS_RECONCILE_INTERVAL)
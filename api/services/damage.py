@@ -0,0 +1,42 @@
+"""
+    Typed representation of damage details of GamePlayerEvent, see `GamePlayerEvent.modifiers`
+    and `DamageCode`. Codes are created on first use and cached for process lifetime.
+"""
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+
+from models import DamageCode, GamePlayerEvent, async_session_maker
+
+_codes: dict[tuple[str, str], int] = {}
+
+
+def modifier_flags(modifiers: dict | None) -> int:
+    """ Pack modifiers sent by plugin into GamePlayerEvent.Modifier flags, unknown ones are skipped """
+    flags = 0
+    for name, value in (modifiers or {}).items():
+        if value and name in GamePlayerEvent.Modifier.__members__:
+            flags |= GamePlayerEvent.Modifier[name]
+    return flags
+
+
+async def get_damage_code(kind: str, name: str | None) -> int | None:
+    """ Code of the weapon or damage type name, created if it is not known yet """
+    if name is None:
+        return None
+
+    key = (kind, name)
+
+    if key not in _codes:
+        # own transaction, so that code survives rollback of the event that introduced it
+        async with async_session_maker() as session:
+            await session.execute(
+                insert(DamageCode).values(kind=kind, name=name).on_conflict_do_nothing(
+                    index_elements=[DamageCode.__table__.c.kind, DamageCode.__table__.c.name]
+                )
+            )
+            code = await session.exec(select(DamageCode.id).where(DamageCode.kind == kind, DamageCode.name == name))
+            _codes[key] = code.one()
+            await session.commit()
+
+    return _codes[key]
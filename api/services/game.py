@@ -11,6 +11,7 @@ from models import Match, InGameTeam, PlayerSession, Game, Player, MatchTeam, Ma
 from events.internal import internalHandler
 from schemas.game import GamePlugin
 from services.minestrike import MineStrike
+from services.counters import game_counter, session_counter
 
 
 PluginMap = {
@@ -70,6 +71,8 @@ async def on_map_pick_done(match: Match, payload):
         Session.add(game)
         Session.commit()
 
+        game_counter.add((game.mode, game.status))
+
         match.games.append(game)
 
         # add players to in-game team
@@ -83,6 +86,7 @@ async def on_map_pick_done(match: Match, payload):
             )
             Session.add(sess)
             Session.commit()
+            session_counter.add((game.mode, sess.state))
 
         for player in match.team_two.players:
             sess = PlayerSession(
@@ -94,6 +98,7 @@ async def on_map_pick_done(match: Match, payload):
             )
             Session.add(sess)
             Session.commit()
+            session_counter.add((game.mode, sess.state))
 
         # only participants are allowed
         game.whitelist.extend([*match.team_one.players, *match.team_two.players])
@@ -198,6 +203,8 @@ async def create_game(game_map: Map | None, mode: Game.Mode, player: Player = No
     Session().add(game)
     Session().commit()
 
+    game_counter.add((game.mode, game.status))
+
     if player is not None and is_whitelisted:
         game.whitelist.append(player)
 
@@ -0,0 +1,256 @@
+"""
+    Write-behind buffer of GamePlayerEvent rows and stats projection deltas.
+
+    Handlers add events, together with the deltas they add to stats of their player, to the buffer
+    instead of writing them. Buffer writes everything with multi-row statements in a single transaction
+    every `EVENT_BUFFER_FLUSH_INTERVAL` seconds or once `EVENT_BUFFER_MAX_ROWS` events are buffered,
+    and once more on shutdown. Deltas are always written in the transaction of their event.
+
+    Deltas that are not committed yet can be read with `pending_player_stats` / `pending_session_stats`,
+    readers of the projections add them to what they've read from the database.
+    Buffered events are lost if process crashes before they are flushed.
+
+    Batch that fails because of the database being unavailable, or not having a partition for its
+    events yet, is kept for the next flush, up to `EVENT_BUFFER_MAX_PENDING` events. Batch that fails
+    otherwise is written again in halves until the rows at fault are isolated, these are dropped
+    together with their deltas and logged.
+"""
+
+import asyncio
+import logging
+import time
+import traceback
+from collections import Counter, defaultdict, deque
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError, OperationalError, InterfaceError
+
+from constants import EVENT_BUFFER_FLUSH_INTERVAL, EVENT_BUFFER_MAX_ROWS, EVENT_BUFFER_MAX_PENDING
+from models import GamePlayerEvent, PlayerStats, PlayerSessionStats, async_session_maker
+from services.stats import increment_stats_many
+
+
+# NOT NULL columns without default, a row missing any of them would fail the whole batch
+REQUIRED_EVENT_COLUMNS = [
+    column.name for column in GamePlayerEvent.__table__.columns
+    if not column.nullable and column.default is None and column.server_default is None and column.name != "id"
+]
+
+
+def _is_transient(e: Exception) -> bool:
+    """ Whether write failed because of the database rather than the rows written """
+    if isinstance(e, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)):
+        return True
+    if not isinstance(e, DBAPIError):
+        return False
+    # partition of the month is not created yet, see services.partitions
+    return e.connection_invalidated or "no partition of relation" in str(e.orig)
+
+
+def _insert_events(rows: list[dict]):
+    return insert(GamePlayerEvent).values(rows)
+
+
+class _Batch:
+
+    def __init__(self, entries: list[tuple[dict, dict[str, int]]] = ()):
+        # event rows with deltas of their player's stats
+        self.entries: list[tuple[dict, dict[str, int]]] = []
+        self.player_stats: dict[int, Counter] = defaultdict(Counter)
+        self.session_stats: dict[tuple[int, int], Counter] = defaultdict(Counter)
+
+        for row, stats in entries:
+            self.add(row, stats)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def events(self) -> list[dict]:
+        return [row for row, _ in self.entries]
+
+    def add(self, row: dict, stats: dict[str, int]):
+        self.entries.append((row, stats))
+        if stats:
+            self.player_stats[row["player_id"]].update(stats)
+            self.session_stats[(row["game_id"], row["player_id"])].update(stats)
+
+    def discard(self, other: "_Batch"):
+        """ Stop counting deltas of other batch, e.g. once they are committed """
+        for player_id, deltas in other.player_stats.items():
+            self.player_stats[player_id].subtract(deltas)
+        for key, deltas in other.session_stats.items():
+            self.session_stats[key].subtract(deltas)
+
+    def player_stats_rows(self) -> list[dict]:
+        return [{"player_id": player_id, **deltas} for player_id, deltas in self.player_stats.items()]
+
+    def session_stats_rows(self) -> list[dict]:
+        return [
+            {"game_id": game_id, "player_id": player_id, **deltas}
+            for (game_id, player_id), deltas in self.session_stats.items()
+        ]
+
+
+class EventBuffer:
+
+    def __init__(self, max_rows: int, interval: float, max_pending: int):
+        self.max_rows = max_rows
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = _Batch()
+        # batch being written, still visible to readers until committed
+        self._in_flight = _Batch()
+        self._lock = asyncio.Lock()
+        self._flush_scheduled = False
+        # milliseconds of recent flushes
+        self.latencies: deque[float] = deque(maxlen=1000)
+        # events not accepted or dropped because buffer was full
+        self.dropped_events = 0
+        # rows the database refused, with the error
+        self.rejected_rows = 0
+        self.dead_letters: deque[tuple[dict, str]] = deque(maxlen=100)
+
+    def add_event(self, stats: dict[str, int] = None, **row) -> bool:
+        """
+            Buffer event row. `stats` are deltas the event adds to stats and session stats of its player,
+            they are written only together with the event. Returns False if the event was not accepted.
+        """
+        missing = [name for name in REQUIRED_EVENT_COLUMNS if row.get(name) is None]
+        if missing:
+            self._reject(row, f"missing {', '.join(missing)}")
+            return False
+
+        if len(self._pending) >= self.max_pending:
+            self.dropped_events += 1
+            return False
+
+        self._pending.add(row, stats or {})
+
+        if len(self._pending) >= self.max_rows and not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.create_task(self.flush())
+
+        return True
+
+    def _reject(self, row: dict, reason: str):
+        self.rejected_rows += 1
+        self.dead_letters.append((row, reason))
+        logging.error(f"Dropped game event row {row}: {reason}")
+
+    def pending_player_stats(self, player_id: int) -> Counter:
+        return self._pending.player_stats.get(player_id, Counter()) + self._in_flight.player_stats.get(player_id, Counter())
+
+    def pending_session_stats(self, game_id: int, player_id: int) -> Counter:
+        key = (game_id, player_id)
+        return self._pending.session_stats.get(key, Counter()) + self._in_flight.session_stats.get(key, Counter())
+
+    async def flush(self):
+        async with self._lock:
+            self._flush_scheduled = False
+
+            if not self._pending:
+                return
+
+            self._in_flight, self._pending = self._pending, _Batch()
+            batch = self._in_flight
+            started = time.perf_counter()
+
+            try:
+                await self._write(batch)
+            except Exception as e:
+                if _is_transient(e):
+                    # keep everything for the next attempt
+                    self._keep(batch)
+                    raise
+
+                logging.error(f"Failed to write batch of game events, writing it in parts: {e!r}")
+                self._keep(await self._write_in_parts(batch))
+            finally:
+                self._in_flight = _Batch()
+
+            elapsed = (time.perf_counter() - started) * 1000
+            self.latencies.append(elapsed)
+            logging.debug(f"Flushed {len(batch)} game events in {elapsed:.1f}ms")
+
+    async def _write(self, batch: _Batch):
+        """ Write events of the batch and their deltas in one transaction """
+        async with async_session_maker() as session:
+            events = batch.events
+            # chunked to stay within statement parameter limit when buffer outgrew max_rows
+            for i in range(0, len(events), self.max_rows):
+                await session.execute(_insert_events(events[i:i + self.max_rows]))
+            if batch.player_stats:
+                await session.execute(increment_stats_many(PlayerStats, batch.player_stats_rows()))
+            if batch.session_stats:
+                await session.execute(increment_stats_many(PlayerSessionStats, batch.session_stats_rows()))
+            await session.commit()
+
+            # deltas are read from the projections from now on, not once the session is closed
+            self._in_flight.discard(batch)
+
+    async def _write_in_parts(self, batch: _Batch) -> _Batch:
+        """ Write what can be written, returns events that failed because of the database to retry them """
+        middle = len(batch.entries) // 2
+        retry = await self._write_bisecting(batch.entries[:middle]) + await self._write_bisecting(batch.entries[middle:])
+        return _Batch(retry)
+
+    async def _write_bisecting(self, entries: list[tuple[dict, dict[str, int]]]) -> list[tuple[dict, dict[str, int]]]:
+        """ Write events in a transaction of their own, halving them on failure until single failing events are dropped """
+        if not entries:
+            return []
+
+        batch = _Batch(entries)
+        try:
+            await self._write(batch)
+            return []
+        except Exception as e:
+            if _is_transient(e):
+                return entries
+            if len(entries) == 1:
+                self._reject(entries[0][0], repr(e))
+                self._in_flight.discard(batch)
+                return []
+
+        middle = len(entries) // 2
+        return await self._write_bisecting(entries[:middle]) + await self._write_bisecting(entries[middle:])
+
+    def _keep(self, batch: _Batch):
+        """ Put batch back to be written by the next flush, dropping oldest events over the limit """
+        entries = [*batch.entries, *self._pending.entries]
+
+        overflow = max(0, len(entries) - self.max_pending)
+        self.dropped_events += overflow
+        self._pending = _Batch(entries[overflow:])
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logging.error("Failed to flush game events")
+                traceback.print_exc()
+
+    def report(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] if latencies else None
+
+        return {
+            "pending_events": len(self._pending),
+            "in_flight_events": len(self._in_flight),
+            "flush_ms_p50": percentile(50),
+            "flush_ms_p99": percentile(99),
+            "flush_ms_max": latencies[-1] if latencies else None,
+            "dropped_events": self.dropped_events,
+            "rejected_rows": self.rejected_rows,
+            "dead_letters": [{"row": repr(row), "reason": reason} for row, reason in self.dead_letters],
+        }
+
+
+event_buffer = EventBuffer(EVENT_BUFFER_MAX_ROWS, EVENT_BUFFER_FLUSH_INTERVAL, EVENT_BUFFER_MAX_PENDING)
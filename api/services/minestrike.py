@@ -13,6 +13,7 @@ from events.internal import internalHandler
 from events.schemas.bukkit import PlayerGameConnectEvent, PlayerLeaveGameEvent, GameTerminatedEvent
 from events.schemas.internal import PlayerLeftGame, PlayerJoinGame, PlayerRosterChange, PlayerStatusChange
 from models import Game, Player, PlayerSession, Session, Team, InGameTeam, ModelBase
+from services.counters import session_counter
 
 
 class MineStrike:
@@ -74,10 +75,13 @@ class MineStrike:
 
         logging.info(f"Player {player.id} leaving game {session.game.id}...")
 
+        old_state = session.state
         session.state = PlayerSession.State.AWAY
         Session().add(session)
         Session().commit()
 
+        session_counter.move((game.mode, old_state), (game.mode, PlayerSession.State.AWAY))
+
         # handle internally
         await internalHandler.propagate_event(event=PlayerLeftGame(session=session), sender=session)
 
@@ -112,6 +116,8 @@ class MineStrike:
             # Delete session if player leaves during warm up in game that does not pre-fill teams
             Session().delete(session)
             Session().commit()
+
+            session_counter.add((game.mode, PlayerSession.State.AWAY), -1)
         else:
             # mark session as away
             session.state = PlayerSession.State.AWAY
@@ -162,6 +168,9 @@ class MineStrike:
 
         session = Session().exec(stmt).first()
 
+        # state session had before joining, None if it is created now
+        old_state = session.state if session else None
+
         # Player doesn't have a session yet. Just create a new one
         if not session:
             session = PlayerSession(
@@ -210,6 +219,11 @@ class MineStrike:
         session.state = PlayerSession.State.IN_GAME
         Session().commit()
 
+        if old_state is None:
+            session_counter.add((game.mode, PlayerSession.State.IN_GAME))
+        else:
+            session_counter.move((game.mode, old_state), (game.mode, PlayerSession.State.IN_GAME))
+
         # update model that was indirectly updated
         # after it was updated, we can be sure that
         # plugin is aware that player is now member of
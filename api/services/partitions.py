@@ -0,0 +1,123 @@
+"""
+    Maintenance of monthly range partitions of GamePlayerEvent table by `created_at`.
+
+    Partitions are named `gameplayerevent_yYYYYmMM`. There is no default partition,
+    so partitions are created months ahead; events that fall outside of existing ones
+    fail to flush and stay buffered until the partition is created, at most
+    `EVENT_BUFFER_MAX_PENDING` of them, see `services.ingestion`.
+"""
+
+import asyncio
+import logging
+import re
+import traceback
+from datetime import date, datetime
+
+from sqlalchemy import text
+from sqlmodel import select, col
+
+from constants import EVENT_PARTITIONS_AHEAD, EVENT_PARTITION_MAINTENANCE_INTERVAL
+from models import GamePlayerEvent, Game, async_session_maker
+from services.archive import archive_game
+
+TABLE = GamePlayerEvent.__tablename__
+
+_NAME = re.compile(rf"^{TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_y{month.year}m{month.month:02d}"
+
+
+def partition_ddl(month: date) -> str:
+    """ Statement creating partition for the month of given date, if it does not exist """
+    month = month.replace(day=1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+async def list_event_partitions(session) -> dict[date, str]:
+    """ Months of attached partitions and their names """
+    res = await session.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+    """), {"table": TABLE})
+
+    partitions = {}
+    for name in res.scalars().all():
+        match = _NAME.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+async def ensure_event_partitions(months_ahead: int = EVENT_PARTITIONS_AHEAD):
+    """ Create partitions from current month up to `months_ahead` months ahead """
+    current = datetime.now().date().replace(day=1)
+
+    async with async_session_maker() as session:
+        for i in range(months_ahead + 1):
+            await session.execute(text(partition_ddl(add_months(current, i))))
+        await session.commit()
+
+
+async def archive_partition(name: str) -> bool:
+    """ Archive games with events in the partition, returns whether none of its events are left """
+    async with async_session_maker() as session:
+        game_ids = (await session.execute(text(f"SELECT DISTINCT game_id FROM {name}"))).scalars().all()
+        games = (await session.exec(select(Game).where(col(Game.id).in_(game_ids)))).all()
+
+    for game in games:
+        if game.status not in (Game.Status.FINISHED, Game.Status.TERMINATED):
+            logging.warning(f"Partition {name} holds events of game {game.id} that is not finished")
+            return False
+
+    archived = [await archive_game(game) for game in games]
+    return all(archived)
+
+
+async def detach_event_partitions(before: date) -> list[str]:
+    """
+        Detach partitions of months before the given one. Events in them are archived first,
+        rebuild of stats projections only knows events that are attached or archived.
+        Partition whose events could not be archived stays attached.
+    """
+    before = before.replace(day=1)
+
+    async with async_session_maker() as session:
+        partitions = await list_event_partitions(session)
+
+    detached = []
+
+    for month, name in sorted(partitions.items()):
+        if month >= before or not await archive_partition(name):
+            continue
+
+        async with async_session_maker() as session:
+            await session.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            await session.commit()
+
+        detached.append(name)
+
+    return detached
+
+
+async def maintain_event_partitions_periodically():
+    while True:
+        try:
+            await ensure_event_partitions()
+        except Exception:
+            logging.error("Failed to maintain game event partitions")
+            traceback.print_exc()
+
+        await asyncio.sleep(EVENT_PARTITION_MAINTENANCE_INTERVAL)
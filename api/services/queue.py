@@ -1,9 +1,11 @@
 import asyncio
 from datetime import datetime
+from functools import partial
 
 from blazelink.schemas import IncomingEvent
 
 from models import Player, PlayerQueue, Match, MapPickProcess, Game, PlayerSession, MatchTeam, Session, MapPick, Map
+from events.executor import run_detached
 from events.internal import internalHandler
 
 
@@ -160,26 +162,39 @@ async def on_player_join_queue(queue: PlayerQueue, payload):
     queue.lock()
 
     # queue is locked, meaning match confirmation started
-    # make sure that in 30 seconds QueueConfirmed event will be fired
+    # make sure that in 60 seconds QueueConfirmed event will be fired.
+    # Waiting happens outside of this handler, it would hold back other events of the queue
+    # and its database session meanwhile
+    confirmed = internalHandler.wait("QueueConfirmed", timeout=60).on(queue)
+    run_detached(None, internalHandler.executor, partial(_await_confirmation, queue.id, confirmed))
+
+
+async def _await_confirmation(queue_id: int, confirmed: asyncio.Future):
     try:
-        await internalHandler.wait("QueueConfirmed", timeout=60).on(queue)
+        await confirmed
     except TimeoutError:
-        # Timed out: did not receive enough confirmations
+        # in order with other events of the queue, see `events.manager.ordering_key`
+        run_detached(("PlayerQueue", str(queue_id)), internalHandler.executor, partial(_unlock_unconfirmed, queue_id))
+
+
+async def _unlock_unconfirmed(queue_id: int):
+    # Timed out: did not receive enough confirmations
+    queue = Session().get(PlayerQueue, queue_id)
 
-        # get players who didn't accept
-        not_confirmed = [player for player in queue.players if player not in queue.confirmed_players]
+    # get players who didn't accept
+    not_confirmed = [player for player in queue.players if player not in queue.confirmed_players]
 
-        print(f"QueueConfirmed was never received. Unlocking queue. Not confirmed: {len(not_confirmed)}")
+    print(f"QueueConfirmed was never received. Unlocking queue. Not confirmed: {len(not_confirmed)}")
 
-        for player in not_confirmed:
-            # remove players who didn't accept from queue
-            queue.players.remove(player)
+    for player in not_confirmed:
+        # remove players who didn't accept from queue
+        queue.players.remove(player)
 
-        # unlock queue, let new players in
-        queue.unlock()
+    # unlock queue, let new players in
+    queue.unlock()
 
-        # delete all player confirmations
-        queue.unconfirm()
+    # delete all player confirmations
+    queue.unconfirm()
 
 
 @internalHandler.on("QueueConfirmed")
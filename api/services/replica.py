@@ -0,0 +1,97 @@
+"""
+    Routing of GraphQL reads to the read replica.
+
+    Replication lag is measured periodically. Reads go to the primary while the replica
+    lags more than allowed, could not be checked, or when the request asks for fresh data
+    (e.g. client reading what it has just written through the REST API).
+    Writers and intent handlers always use the primary through `Session`/`AsyncSession`.
+"""
+
+import asyncio
+import logging
+import time
+import traceback
+
+from sqlalchemy import text
+
+from constants import REPLICA_MAX_LAG, REPLICA_LAG_CHECK_INTERVAL, FRESH_READ_HEADER
+from models import async_replica_session_maker, replica_session_maker, session_maker, async_session_maker
+from settings import settings
+
+# zero when replica has replayed everything it received and is still receiving, so that an idle
+# primary does not look like lag. Replica whose WAL receiver is not streaming has received everything
+# it is going to, its lag is age of the last replayed transaction. Not a replica (e.g. second local
+# database used for testing) reads as no lag.
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+            AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 'Infinity'::float8)
+    END
+""")
+
+
+class ReplicaMonitor:
+
+    def __init__(self, enabled: bool, max_lag: float):
+        self.enabled = enabled
+        self.max_lag = max_lag
+        self.lag: float | None = None
+        self.checked_at: float | None = None
+        self.replica_reads = 0
+        self.primary_reads = 0
+
+    async def check(self):
+        async with async_replica_session_maker() as session:
+            self.lag = float((await session.execute(LAG_QUERY)).scalar())
+        self.checked_at = time.monotonic()
+
+    def usable(self) -> bool:
+        if not self.enabled or self.lag is None or self.checked_at is None:
+            return False
+
+        # result of a check that stopped coming back can not be trusted
+        if time.monotonic() - self.checked_at > 2 * REPLICA_LAG_CHECK_INTERVAL + self.max_lag:
+            return False
+
+        return self.lag <= self.max_lag
+
+    def session_makers(self, fresh=False) -> tuple:
+        """ (sync, async) session makers to read with """
+        if not fresh and self.usable():
+            self.replica_reads += 1
+            return replica_session_maker, async_replica_session_maker
+
+        self.primary_reads += 1
+        return session_maker, async_session_maker
+
+    def report(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "usable": self.usable(),
+            "lag_s": self.lag,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+        }
+
+    async def monitor_periodically(self):
+        if not self.enabled:
+            return
+
+        while True:
+            try:
+                await self.check()
+            except Exception:
+                self.lag = None
+                logging.error("Failed to check replication lag")
+                traceback.print_exc()
+
+            await asyncio.sleep(REPLICA_LAG_CHECK_INTERVAL)
+
+
+def wants_fresh_data(request) -> bool:
+    return request is not None and bool(request.headers.get(FRESH_READ_HEADER))
+
+
+replica_monitor = ReplicaMonitor(bool(settings.database_replica_host), REPLICA_MAX_LAG)
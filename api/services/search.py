@@ -0,0 +1,67 @@
+"""
+    Ranked player search by username.
+
+    Exact matches go first, then prefix matches, then the rest by trigram similarity.
+    Filter only uses operators the trigram GIN index on username supports (see `ix_player_username_trgm`),
+    `scripts.bench_player_search` shows whether the planner picks it for a given table size.
+"""
+
+from uuid import UUID
+
+from sqlalchemy import case, func, or_
+from sqlmodel import select, col
+
+from models import Player, Session
+
+
+def _escape_like(query: str) -> str:
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def player_search_filter(query: str):
+    """ Condition matching players whose username contains query or is similar to it """
+    username = col(Player.username)
+    return or_(
+        username.ilike(f"%{_escape_like(query)}%", escape="\\"),
+        username.op("%")(query),
+    )
+
+
+def player_search_order(query: str) -> list[tuple]:
+    """ (expression, descending) keys ranking search results, best match first """
+    escaped = _escape_like(query)
+    username = col(Player.username)
+
+    rank = case(
+        [
+            (username.ilike(escaped, escape="\\"), 0),
+            (username.ilike(f"{escaped}%", escape="\\"), 1),
+        ],
+        else_=2
+    )
+
+    return [
+        (rank, False),
+        (func.similarity(username, query), True),
+    ]
+
+
+def find_player(query: str) -> Player | None:
+    """ Player with given uuid or best search match for given username """
+    try:
+        uuid = UUID(query)
+    except ValueError:
+        uuid = None
+
+    if uuid is not None:
+        player = Session().exec(select(Player).where(Player.uuid == uuid)).first()
+        if player:
+            return player
+
+    stmt = (
+        select(Player)
+        .where(player_search_filter(query))
+        .order_by(*[key.desc() if desc else key.asc() for key, desc in player_search_order(query)])
+        .limit(1)
+    )
+    return Session().exec(stmt).first()
@@ -0,0 +1,153 @@
+"""
+    Maintenance of aggregated stats projections.
+
+    Functions here build statements instead of executing them, so that both
+    sync and async handlers can run them inside their own transaction.
+"""
+
+from sqlalchemy import func, case, cast, Integer, delete, and_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select, col
+
+from models import PlayerStats, GamePlayerEvent, PlayerSession, Game, Leaderboard, Player, PlayerSessionStats
+
+GAME_RESULT_FIELDS = ['games_played', 'games_won', 'ranked_games_played', 'ranked_games_won']
+LEADERBOARD_FIELDS = ['games_played', 'wins', 'winrate_bp']
+
+
+def _upsert(stmt, columns: list[str], accumulate=True, model=PlayerStats):
+    """ Make insert into projection add to (or overwrite) given columns of already existing row """
+    table = model.__table__
+
+    return stmt.on_conflict_do_update(
+        index_elements=list(table.primary_key.columns),
+        set_={
+            name: (table.c[name] + stmt.excluded[name]) if accumulate else stmt.excluded[name]
+            for name in columns
+        }
+    )
+
+
+def increment_stats_many(model, rows: list[dict]):
+    """ Add deltas of many rows at once, rows are keyed by primary key columns of the projection """
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    fields = list(dict.fromkeys(name for row in rows for name in row if name not in keys))
+    values = [{name: row.get(name, 0) for name in [*keys, *fields]} for row in rows]
+    return _upsert(insert(model).values(values), fields, model=model)
+
+
+def update_game_score(game_id: int, old_winner_id: int | None, new_winner_id: int | None):
+    """ Move round from score of its old winner to score of the new one """
+
+    def delta(team_id):
+        return case([(team_id == new_winner_id, 1)], else_=0) - case([(team_id == old_winner_id, 1)], else_=0)
+
+    return (
+        update(Game)
+        .where(Game.id == game_id)
+        .values(
+            score_a=Game.score_a + delta(Game.team_a_id),
+            score_b=Game.score_b + delta(Game.team_b_id),
+        )
+    )
+
+
+def _game_results(*where):
+    """ Select games played/won per player from sessions of finished games """
+    won = cast(PlayerSession.roster_id == Game.winner_id, Integer)
+    ranked = cast(Game.mode == Game.Mode.RANKED, Integer)
+
+    return (
+        select(
+            PlayerSession.player_id,
+            func.count().label('games_played'),
+            func.coalesce(func.sum(won), 0).label('games_won'),
+            func.sum(ranked).label('ranked_games_played'),
+            func.coalesce(func.sum(won * ranked), 0).label('ranked_games_won'),
+        )
+        .join(Game, onclause=Game.id == PlayerSession.game_id)
+        .where(PlayerSession.roster_id != None, *where)
+        .group_by(PlayerSession.player_id)
+    )
+
+
+def record_game_result(game_id: int):
+    """ Count finished game for everyone who played in it """
+    results = _game_results(PlayerSession.game_id == game_id)
+    stmt = insert(PlayerStats).from_select(['player_id', *GAME_RESULT_FIELDS], results)
+    return _upsert(stmt, GAME_RESULT_FIELDS)
+
+
+def game_players(game_id: int):
+    """ Select ids of players who played in the game """
+    return select(PlayerSession.player_id).where(PlayerSession.game_id == game_id, PlayerSession.roster_id != None)
+
+
+def refresh_leaderboard(*where):
+    """ Copy game results of players matching the condition into leaderboard """
+    games_played = func.coalesce(PlayerStats.games_played, 0)
+    wins = func.coalesce(PlayerStats.games_won, 0)
+    winrate_bp = func.coalesce(wins * 10000 / func.nullif(games_played, 0), 0)
+
+    rows = (
+        select(Player.id, games_played, wins, winrate_bp)
+        .join(PlayerStats, isouter=True, onclause=PlayerStats.player_id == Player.id)
+        .where(*where)
+    )
+    stmt = insert(Leaderboard).from_select(['player_id', *LEADERBOARD_FIELDS], rows)
+
+    return stmt.on_conflict_do_update(
+        index_elements=[Leaderboard.__table__.c.player_id],
+        set_={name: stmt.excluded[name] for name in LEADERBOARD_FIELDS}
+    )
+
+
+def rebuild_player_stats(archived: list[dict] = ()) -> list:
+    """
+        Statements recomputing the whole projection from raw events and sessions.
+        Events of archived games are not in the database, their per session stats are passed in `archived`.
+    """
+
+    def counter(event_type, *extra):
+        return func.coalesce(func.sum(case([(and_(GamePlayerEvent.event == event_type, *extra), 1)], else_=0)), 0)
+
+    headshot = col(GamePlayerEvent.modifiers).op('&')(int(GamePlayerEvent.Modifier.headshot)) != 0
+
+    def events(*group_by):
+        return select(
+            *group_by,
+            counter(GamePlayerEvent.Type.KILL).label('kills'),
+            counter(GamePlayerEvent.Type.DEATH).label('deaths'),
+            counter(GamePlayerEvent.Type.ASSIST).label('assists'),
+            counter(GamePlayerEvent.Type.KILL, headshot).label('hs'),
+        ).group_by(*group_by)
+
+    event_fields = ['kills', 'deaths', 'assists', 'hs']
+
+    results = _game_results(Game.status == Game.Status.FINISHED)
+
+    # player totals are summed from per session stats, which include archived games
+    totals = select(
+        PlayerSessionStats.player_id,
+        *[func.sum(getattr(PlayerSessionStats, name)) for name in event_fields]
+    ).group_by(PlayerSessionStats.player_id)
+
+    return [
+        delete(PlayerSessionStats),
+        insert(PlayerSessionStats).from_select(
+            ['game_id', 'player_id', *event_fields],
+            events(GamePlayerEvent.game_id, GamePlayerEvent.player_id)
+        ),
+        *[
+            increment_stats_many(PlayerSessionStats, archived[i:i + 1000])
+            for i in range(0, len(archived), 1000)
+        ],
+        delete(PlayerStats),
+        insert(PlayerStats).from_select(['player_id', *event_fields], totals),
+        _upsert(
+            insert(PlayerStats).from_select(['player_id', *GAME_RESULT_FIELDS], results),
+            GAME_RESULT_FIELDS,
+            accumulate=False
+        ),
+        refresh_leaderboard(),
+    ]
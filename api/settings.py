@@ -7,8 +7,18 @@ class Settings(BaseSettings):
     database_name: str = Field(..., env="DATABASE_NAME")
     database_user: str = Field(..., env="DATABASE_USER")
     database_password: str = Field(..., env="DATABASE_PASSWORD")
+    # optional streaming replica serving GraphQL reads, same credentials as the primary
+    database_replica_host: str | None = Field(None, env="DATABASE_REPLICA_HOST")
+    database_replica_port: int | None = Field(None, env="DATABASE_REPLICA_PORT")
     telegram_token: SecretStr = Field(..., env="TELEGRAM_TOKEN")
     chat_id: int = Field(..., env="CHAT_ID")
+    events_archive_dir: str = Field("archive/events", env="EVENTS_ARCHIVE_DIR")
+    database_pool_size: int = Field(200, env="DATABASE_POOL_SIZE")
+    database_max_overflow: int = Field(0, env="DATABASE_MAX_OVERFLOW")
+    # requests handled at once before REST requests are rejected, GraphQL reads are rejected
+    # once this share of the limit or of the database pool is in use. Bukkit events are never rejected.
+    admission_limit: int = Field(150, env="ADMISSION_LIMIT")
+    admission_low_priority_share: float = Field(0.6, env="ADMISSION_LOW_PRIORITY_SHARE")
 
     @property
     def database_url(self):
@@ -18,6 +28,17 @@ class Settings(BaseSettings):
     def async_database_url(self):
         return f"postgresql+asyncpg://{self.database_user}:{self.database_password}@{self.database_host}:{self.database_port}/{self.database_name}"
 
+    @property
+    def replica_database_url(self):
+        return self.database_url.replace(
+            f"@{self.database_host}:{self.database_port}/",
+            f"@{self.database_replica_host}:{self.database_replica_port or self.database_port}/",
+        )
+
+    @property
+    def async_replica_database_url(self):
+        return self.replica_database_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
     class Config:
         env_file = ".env"
 
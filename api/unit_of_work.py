@@ -0,0 +1,168 @@
+"""
+    Lifecycle of scoped database sessions.
+
+    `Session` and `AsyncSession` hand out sessions of the current unit of work. A unit of work
+    belongs to a single task: it is opened explicitly with `unit_of_work` or implicitly the first
+    time a task without one touches a session, and closes all its sessions when the block exits
+    or the task finishes. Tasks spawned from a unit of work get their own, so a handler running
+    in the background can not use (or lose) a session of the request that spawned it.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+import traceback
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from sqlalchemy.engine import Engine
+
+from constants import SESSION_HOLD_WARNING, SESSION_WATCH_INTERVAL
+
+
+class UnitOfWork:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.task = _current_task()
+        self.started_at = time.monotonic()
+        self.sessions = {}
+        self.closed = False
+        self.reported = False
+        _open.add(self)
+
+    def held_for(self) -> float:
+        return time.monotonic() - self.started_at
+
+    async def close(self):
+        self.closed = True
+        _open.discard(self)
+
+        sessions, self.sessions = self.sessions, {}
+        if sessions and self.held_for() > SESSION_HOLD_WARNING:
+            logging.warning(f"Unit of work '{self.name}' held database sessions for {self.held_for():.1f}s")
+
+        for session in sessions.values():
+            closed = session.close()
+            if inspect.isawaitable(closed):
+                await closed
+
+
+_open: set[UnitOfWork] = set()
+
+# closing of units of work of finished tasks, loop keeps only weak references to tasks
+_closing: set[asyncio.Task] = set()
+
+_unit_of_work: ContextVar[UnitOfWork | None] = ContextVar("unit_of_work", default=None)
+
+
+def _current_task() -> asyncio.Task | None:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        # sync route handlers run in a thread pool, scripts run without a loop
+        return None
+
+
+def current_unit_of_work() -> UnitOfWork:
+    uow = _unit_of_work.get()
+    task = _current_task()
+
+    # threads inherit unit of work of the task waiting for them
+    if uow is not None and not uow.closed and (task is None or uow.task is task):
+        return uow
+
+    uow = UnitOfWork(task.get_name() if task else "main")
+    _unit_of_work.set(uow)
+
+    if task is not None:
+        task.add_done_callback(lambda _: _close_later(uow))
+
+    return uow
+
+
+def _close_later(uow: UnitOfWork):
+    closing = asyncio.ensure_future(uow.close())
+    _closing.add(closing)
+    closing.add_done_callback(_closed)
+
+
+def _closed(closing: asyncio.Task):
+    _closing.discard(closing)
+
+    if not closing.cancelled() and closing.exception() is not None:
+        logging.error(f"Failed to close database sessions: {closing.exception()!r}")
+        traceback.print_exception(closing.exception())
+
+
+async def wait_closed():
+    """ Wait until units of work of finished tasks are closed, e.g. on shutdown """
+    while _closing:
+        await asyncio.gather(*_closing, return_exceptions=True)
+
+
+@asynccontextmanager
+async def unit_of_work(name: str):
+    """ Run block with its own sessions, closed when it exits """
+    previous = _unit_of_work.get()
+    uow = UnitOfWork(name)
+    _unit_of_work.set(uow)
+    try:
+        yield uow
+    finally:
+        _unit_of_work.set(previous)
+        await uow.close()
+
+
+class UnitOfWorkRegistry:
+    """ Replacement of `ScopedRegistry` of scoped sessions, keeping the session on current unit of work """
+
+    def __init__(self, createfunc, key: str):
+        self.createfunc = createfunc
+        self.key = key
+
+    def __call__(self):
+        sessions = current_unit_of_work().sessions
+        if self.key not in sessions:
+            sessions[self.key] = self.createfunc()
+        return sessions[self.key]
+
+    def has(self) -> bool:
+        return self.key in current_unit_of_work().sessions
+
+    def set(self, obj):
+        current_unit_of_work().sessions[self.key] = obj
+
+    def clear(self):
+        current_unit_of_work().sessions.pop(self.key, None)
+
+
+def report(engines: dict[str, Engine]) -> dict:
+    holding = [uow for uow in _open if uow.sessions]
+
+    return {
+        "open_units_of_work": len(_open),
+        "open_sessions": sum(len(uow.sessions) for uow in holding),
+        "longest_held_s": max((uow.held_for() for uow in holding), default=None),
+        "checked_out_connections": {name: engine.pool.checkedout() for name, engine in engines.items()},
+    }
+
+
+def _report_held_sessions():
+    for uow in list(_open):
+        if uow.sessions and not uow.reported and uow.held_for() > SESSION_HOLD_WARNING:
+            uow.reported = True
+            logging.warning(f"Unit of work '{uow.name}' is holding database sessions for {uow.held_for():.1f}s")
+
+
+async def watch_held_sessions_periodically():
+    """ Report sessions that were not released, closing only logs sessions that are eventually released """
+    while True:
+        try:
+            _report_held_sessions()
+        except Exception:
+            logging.error("Failed to check held database sessions")
+            traceback.print_exc()
+
+        await asyncio.sleep(SESSION_WATCH_INTERVAL)